@@ -1,13 +1,20 @@
 import streamlit as st
-import google.generativeai as genai
-import speech_recognition as sr
-from gtts import gTTS
 from audiorecorder import audiorecorder
 import streamlit.components.v1 as components
-import io
-import re
-import base64
+import json
 import time
+import uuid
+
+from assistant import metrics
+from assistant.audio_store import prepare_player_sources, session_audio_report
+from assistant.audio_workers import get_audio_workers
+from assistant.engine import answer_question
+from assistant.gemini import create_model
+from assistant.history import compact_history, context_report, restore_history
+from assistant.request_engine import BackendBusyError, CancelToken, QueryCancelled, cancel_scope, get_request_engine
+from assistant.streaming import STREAM_RESPONSES
+from assistant.stt import finish_recognition, start_recognition
+from assistant.warmup import WARMUP_ON_START, start_background_warmup
 
 # --- الإعدادات الأولية ---
 st.set_page_config(
@@ -16,9 +23,16 @@ st.set_page_config(
     page_icon="🏛️"
 )
 
+# --- إعداد نموذج Gemini ---
+@st.cache_resource(show_spinner=False)
+def load_model():
+    """إنشاء النموذج مرة واحدة لكل عملية ومشاركته بين كل الجلسات وإعادات التشغيل"""
+    return create_model(st.secrets["GEMINI_API_KEY"])
+
+
 # تحميل مفتاح Gemini API من st.secrets
 try:
-    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+    model = load_model()
 except KeyError:
     st.error("لم يتم العثور على مفتاح GEMINI_API_KEY. يرجى إضافته إلى .streamlit/secrets.toml")
     st.stop()
@@ -26,101 +40,97 @@ except Exception as e:
     st.error(f"حدث خطأ أثناء إعداد واجهة Gemini: {e}")
     st.stop()
 
-# --- إعداد نموذج Gemini ---
-generation_config = {
-    "temperature": 0.7,
-    "top_p": 1,
-    "top_k": 1,
-    "max_output_tokens": 2048,
-}
-safety_settings = [
-    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-]
-
-system_instruction = """أنت مساعد ذكي متخصص في التاريخ المصري والشخصيات التاريخية المصرية.
-
-قواعد مهمة جداً:
-1. استخدم اللغة العربية الفصحى في جميع إجاباتك
-2. اكتب إجابتك على شكل نقاط منفصلة، كل نقطة في سطر جديد
-3. كل نقطة يجب أن تكون جملة كاملة ومفيدة (جملة أو جملتين)
-4. اكتب من 3 إلى 5 نقاط فقط
-5. لا تكتب ترحيب في البداية - ابدأ مباشرة بالمعلومات
-6. ابدأ كل نقطة بـ "•" أو "-"
-
-مثال على الرد المطلوب:
-• توت عنخ آمون كان فرعوناً مصرياً حكم مصر وهو في التاسعة من عمره
-• اكتشف هوارد كارتر مقبرته عام 1922 وكانت مليئة بالكنوز الثمينة
-• تعتبر المقبرة من أهم الاكتشافات الأثرية في التاريخ
-• توفي في سن التاسعة عشرة والسبب لا يزال غامضاً
-
-تذكر: نقاط قصيرة ومفيدة باللغة العربية الفصحى!"""
-
-model = genai.GenerativeModel(
-    model_name="gemini-2.5-flash",
-    generation_config=generation_config,
-    system_instruction=system_instruction,
-    safety_settings=safety_settings
-)
+# نقطة /metrics المشتركة (تعمل مرة واحدة لكل عملية عند ضبط METRICS_PORT)
+metrics.start_metrics_server()
 
+# تسخين ذاكرة الإجابات والصوت بالأسئلة الشائعة في الخلفية (مرة واحدة لكل عملية)
+if WARMUP_ON_START:
+    start_background_warmup(model)
 
-# --- الدوال المساعدة ---
+# عدد رسائل السجل المعروضة في كل مرة (الأقدم خلف زر "عرض رسائل أقدم")
+HISTORY_PAGE_SIZE = 10
 
-def transcribe_audio(audio_segment):
-    """تحويل الصوت إلى نص عربي"""
-    recognizer = sr.Recognizer()
-    try:
-        wav_bytes = audio_segment.export(format="wav").read()
-        audio_data = io.BytesIO(wav_bytes)
-        with sr.AudioFile(audio_data) as source:
-            audio = recognizer.record(source)
-        text = recognizer.recognize_google(audio, language="ar-SA")
-        return text
-    except sr.UnknownValueError:
-        return "لم أستطع فهم الصوت. يرجى المحاولة مرة أخرى."
-    except sr.RequestError as e:
-        return f"خطأ في خدمة التعرف على الكلام: {e}"
-    except Exception as e:
-        return f"خطأ غير متوقع في معالجة الصوت: {e}"
 
+# --- الدوال المساعدة ---
+
+def start_transcription(audio_segment):
+    """بدء تحويل التسجيل إلى نص في الخلفية حتى لا تنتظر الواجهة خدمة التعرف"""
+    future = start_recognition(audio_segment, owner=st.session_state.session_id)
+    return {"future": future, "started": time.perf_counter()}
 
-def generate_tts_audio(text):
-    """تحويل النص إلى صوت"""
-    try:
-        tts = gTTS(text=text, lang='ar', slow=False)
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        audio_fp.seek(0)
-        return audio_fp.read()
-    except Exception as e:
-        st.error(f"حدث خطأ أثناء إنشاء الصوت: {e}")
-        return None
 
+def finish_transcription(transcription):
+    """انتظار نتيجة التحويل وإرجاع (النص، رسالة الخطأ)"""
+    text, error = finish_recognition(transcription["future"])
+    if error is None:
+        metrics.observe("transcribe", time.perf_counter() - transcription["started"])
+    return text, error
 
-def extract_bullet_points(text):
-    """استخراج النقاط من النص"""
-    lines = text.split('\n')
-    bullets = []
 
-    for line in lines:
-        line = line.strip()
-        line = re.sub(r'^[•\-\*]\s*', '', line)
-        if line and len(line) > 10:
-            bullets.append(line)
+def answer_with_gemini(user_text):
+    """إرسال السؤال عبر خط المعالجة المشترك وعرض الرد
 
-    return bullets if bullets else [text]
+    مع البث تُعرض كل نقطة فور اكتمالها. ترجع (الإجابة، هل عُرض الرد بالفعل)،
+    والإجابة None عند فشل Gemini بعد عرض رسالة الخطأ.
+    """
+    placeholder = st.empty()
 
+    def render_bullets(bullets):
+        placeholder.markdown("\n\n".join([f"• {b}" for b in bullets]))
 
-def get_gemini_response(prompt_text):
-    """إرسال الرسالة لـ Gemini مرة واحدة فقط"""
     try:
-        chat_session = st.session_state.chat_session
-        response = chat_session.send_message(prompt_text)
-        return response.text
+        with st.spinner("🤔 Gemini يفكر في الرد..."):
+            answer = answer_question(
+                model, user_text,
+                chat_session=st.session_state.chat_session,
+                stream=STREAM_RESPONSES,
+                on_bullet=render_bullets,
+            )
+    except QueryCancelled:
+        raise
     except Exception as e:
-        return f"حدث خطأ أثناء التواصل مع Gemini: {e}"
+        # الرد المنقطع لا يُعرض ولا يُحوَّل إلى صوت ولا يُحفظ
+        placeholder.error(f"حدث خطأ أثناء التواصل مع Gemini: {e}")
+        return None, True
+
+    for error in answer.errors:
+        st.error(f"حدث خطأ أثناء إنشاء الصوت: {error}")
+    return answer, STREAM_RESPONSES and answer.source == "gemini"
+
+
+def cancel_active_query():
+    """إلغاء السؤال الجاري وتحويل الصوت ومهام الصوت الخاصة بالجلسة (تُستدعى قبل إعادة التشغيل)"""
+    if st.session_state.get("query_token") is not None:
+        st.session_state.query_token.cancel()
+        st.session_state.query_token = None
+    if st.session_state.get("transcription") is not None:
+        st.session_state.transcription["future"].cancel()
+        st.session_state.transcription = None
+    get_audio_workers().cancel(st.session_state.session_id)
+    st.session_state.pending_query = None
+    st.session_state.processing = False
+
+
+def summarize_history(previous_summary, transcript):
+    """تلخيص الأدوار القديمة مع الملخص السابق عبر Gemini"""
+    prompt = (
+        "لخّص المحادثة التالية في نقاط قصيرة تحفظ الشخصيات والمعلومات المهمة فقط.\n\n"
+        f"الملخص السابق:\n{previous_summary or 'لا يوجد'}\n\n"
+        f"المحادثة:\n{transcript}"
+    )
+    with metrics.timed("history_summary"):
+        response = get_request_engine().run(
+            "gemini", model.generate_content, prompt, generation_config={"max_output_tokens": 400}
+        )
+    return response.text
+
+
+def manage_chat_history():
+    """ضغط سجل Gemini قبل الإرسال حتى لا يكبر السياق مع طول المحادثة"""
+    chat_session = st.session_state.chat_session
+    compacted = compact_history(chat_session.history, summarize_history)
+    if compacted is not None:
+        chat_session.history = compacted
 
 
 def apply_egyptian_theme():
@@ -247,24 +257,22 @@ def apply_egyptian_theme():
 """, unsafe_allow_html=True)
 
 
-def create_sequential_audio_player(audio_list):
+def create_sequential_audio_player(audio_ids):
     """إنشاء مشغل صوتي يشغل التسجيلات بالتتابع تلقائياً"""
     # هذا الكود مطابق تماماً للكود في app.py
-    if not audio_list:
+    if not audio_ids:
         return
 
-    # تحويل الصوت لـ base64
-    audio_data_list = []
-    for audio_bytes in audio_list[:10]:
-        if audio_bytes:
-            b64 = base64.b64encode(audio_bytes).decode()
-            audio_data_list.append(b64)
+    # حفظ المقاطع على الخادم وتمرير روابط قصيرة بدلاً من تضمينها base64
+    # (أو ملف واحد متصل مع بداية كل نقطة عند تفعيل SINGLE_AUDIO_STREAM)
+    sources, chapters = prepare_player_sources(audio_ids, owner=st.session_state.session_id)
 
-    if not audio_data_list:
+    if not sources:
         return
 
-    # إنشاء قائمة بصيغة JavaScript
-    audio_sources = ',\n'.join([f'        "data:audio/mp3;base64,{src}"' for src in audio_data_list])
+    # إنشاء قائمة بصيغة JavaScript: لكل جزء [الرابط، النوع] بالأفضلية (opus ثم mp3)
+    audio_sources = json.dumps(sources)
+    chapter_starts = json.dumps(chapters)
 
     html_code = f"""
     <!DOCTYPE html>
@@ -299,6 +307,15 @@ def create_sequential_audio_player(audio_list):
                 margin: 10px 0;
                 font-weight: bold;
             }}
+            #chapters {{
+                text-align: center;
+            }}
+            #chapters button {{
+                margin: 0 3px;
+                border-radius: 50%;
+                border: 1px solid #c49b63;
+                cursor: pointer;
+            }}
         </style>
     </head>
     <body>
@@ -307,21 +324,36 @@ def create_sequential_audio_player(audio_list):
                 متصفحك لا يدعم تشغيل الصوت
             </audio>
             <div id="status">جاري التحميل...</div>
+            <div id="chapters"></div>
         </div>
 
         <script>
-            const audioSources = [
-{audio_sources}
-            ];
+            // يتم تحميل كل مقطع من رابطه فقط عند الوصول إليه
+            const audioSources = {audio_sources};
+            // بدايات النقاط داخل الملف الواحد (فارغة عند تشغيل مقاطع منفصلة)
+            const chapters = {chapter_starts};
 
             let currentIndex = 0;
             const player = document.getElementById('audio-player');
             const status = document.getElementById('status');
 
+            // أول مصدر يدعمه المتصفح (Safari مثلاً لا يشغّل opus فيأخذ نسخة mp3)
+            function playableSource(candidates) {{
+                const found = candidates.find(function(candidate) {{
+                    return player.canPlayType(candidate[1]);
+                }});
+                return found ? found[0] : null;
+            }}
+
             function playNext() {{
                 if (currentIndex < audioSources.length) {{
+                    const source = playableSource(audioSources[currentIndex]);
+                    if (!source) {{
+                        status.textContent = '⚠️ المتصفح لا يدعم صيغة الصوت (' + audioSources[currentIndex][0][1] + ')';
+                        return;
+                    }}
                     status.textContent = 'جاري تشغيل الجزء ' + (currentIndex + 1) + ' من ' + audioSources.length;
-                    player.src = audioSources[currentIndex];
+                    player.src = source;
                     player.load();
 
                     // محاولة التشغيل
@@ -351,6 +383,32 @@ def create_sequential_audio_player(audio_list):
                 playNext();
             }});
 
+            // عرض تقدم النقاط والتنقل بينها بالبحث داخل نفس الملف
+            if (chapters.length) {{
+                const chapterNav = document.getElementById('chapters');
+
+                player.addEventListener('timeupdate', function() {{
+                    if (player.ended) {{
+                        return;
+                    }}
+                    let index = 0;
+                    while (index + 1 < chapters.length && chapters[index + 1] <= player.currentTime) {{
+                        index++;
+                    }}
+                    status.textContent = 'جاري تشغيل الجزء ' + (index + 1) + ' من ' + chapters.length;
+                }});
+
+                chapters.forEach(function(start, index) {{
+                    const button = document.createElement('button');
+                    button.textContent = index + 1;
+                    button.addEventListener('click', function() {{
+                        player.currentTime = start;
+                        player.play();
+                    }});
+                    chapterNav.appendChild(button);
+                }});
+            }}
+
             // بدء التشغيل
             playNext();
         </script>
@@ -358,23 +416,25 @@ def create_sequential_audio_player(audio_list):
     </html>
     """
 
-    components.html(html_code, height=150, scrolling=False)
-
+    components.html(html_code, height=180 if chapters else 150, scrolling=False)
 
-# --- واجهة التطبيق ---
-
-# تطبيق الثيم المصري
-apply_egyptian_theme()
 
-st.markdown('<h1 style="text-align: center;">🏛️ مساعد Gemini الصوتي - التاريخ المصري</h1>', unsafe_allow_html=True)
-
-st.markdown("""
+# ترويسة الصفحة في عنصر markdown واحد بدلاً من عنصرين
+HEADER_HTML = """<h1 style="text-align: center;">🏛️ مساعد Gemini الصوتي - التاريخ المصري</h1>
 <div style="text-align: center; padding: 1rem; background: linear-gradient(90deg, transparent, rgba(139,69,19,0.1), transparent); border-radius: 10px; margin-bottom: 1rem;">
     <p style="color: #8b4513; font-size: 1.1rem; margin: 0;">
         🔺 اسأل عن الشخصيات التاريخية المصرية، وسأجيب عليك باللغة العربية الفصحى! 🔺
     </p>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+
+# --- واجهة التطبيق ---
+
+# تطبيق الثيم المصري
+apply_egyptian_theme()
+
+st.markdown(HEADER_HTML, unsafe_allow_html=True)
 
 # --- إعداد Session State ---
 if "chat_session" not in st.session_state:
@@ -383,8 +443,8 @@ if "chat_session" not in st.session_state:
 if "display_history" not in st.session_state:
     st.session_state.display_history = []
 
-if "current_audio_list" not in st.session_state:
-    st.session_state.current_audio_list = []
+if "current_audio_ids" not in st.session_state:
+    st.session_state.current_audio_ids = []
 
 if "is_active_chat" not in st.session_state:
     st.session_state.is_active_chat = False
@@ -404,71 +464,130 @@ if "pending_query" not in st.session_state:
 if "query_source" not in st.session_state:
     st.session_state.query_source = None
 
+# تحويل الصوت الجاري في الخلفية (Future) إلى أن يصبح النص جاهزاً
+if "transcription" not in st.session_state:
+    st.session_state.transcription = None
+
+# علامة إلغاء السؤال الجاري
+if "query_token" not in st.session_state:
+    st.session_state.query_token = None
+
+# معرّف الجلسة لإلغاء مهامها في مجمع عمليات الصوت
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+if "history_visible" not in st.session_state:
+    st.session_state.history_visible = HISTORY_PAGE_SIZE
+
 # --- عرض سجل المحادثة ---
-for message in st.session_state.display_history:
+# نعرض آخر الرسائل فقط حتى يبقى زمن إعادة التشغيل ثابتاً مع طول المحادثة،
+# والرسائل الأقدم لا تُرسم إلا عند طلبها
+hidden_count = max(0, len(st.session_state.display_history) - st.session_state.history_visible)
+
+if hidden_count:
+    if st.button(f"⬆️ عرض رسائل أقدم ({hidden_count})", use_container_width=True, key="load_more_history"):
+        st.session_state.history_visible += HISTORY_PAGE_SIZE
+        st.rerun()
+
+for message in st.session_state.display_history[hidden_count:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
 # --- معالجة الاستعلام المعلق وعرض الرد قبل حقل الإدخال ---
-if st.session_state.pending_query:
-    user_text = st.session_state.pending_query
-    query_source = st.session_state.query_source
-
-    # عرض رسالة المستخدم
+user_bubble_rendered = False
+if st.session_state.transcription is not None:
+    # الصوت يُحوَّل إلى نص في الخلفية منذ لحظة وصول التسجيل، ونعرض حالته حياً
     with st.chat_message("user"):
-        st.markdown(user_text)
-
-    # عرض حالة المعالجة
-    with st.chat_message("assistant"):
-        # إذا كان المصدر صوتي، نعرض رسالة معالجة الصوت أولاً
-        if query_source == 'audio':
-            with st.spinner("⏳ جاري معالجة الصوت..."):
-                pass
+        user_bubble = st.empty()
+        user_bubble.markdown("🎙️ _جاري تحويل الصوت إلى نص..._")
+        user_text, transcription_error = finish_transcription(st.session_state.transcription)
+        st.session_state.transcription = None
+        if transcription_error:
+            user_bubble.error(transcription_error)
+            st.session_state.processing = False
+            st.session_state.query_source = None
+        else:
+            user_bubble.markdown(user_text)
+            st.session_state.is_active_chat = True
+            st.session_state.pending_query = user_text
+            user_bubble_rendered = True
 
-        # عرض حالة التفكير
-        with st.spinner("🤔 Gemini يفكر في الرد..."):
-            full_response = get_gemini_response(user_text)
-
-        # استخراج النقاط
-        bullets = extract_bullet_points(full_response)
-
-        if bullets:
-            # توليد الصوت أولاً قبل عرض النص
-            with st.spinner("🎵 جاري تحويل الردود إلى صوت..."):
-                audio_list = []
-                for bullet in bullets[:10]:
-                    audio = generate_tts_audio(bullet)
-                    if audio:
-                        audio_list.append(audio)
-
-                st.session_state.current_audio_list = audio_list
-
-            # الآن نعرض النص بعد أن أصبح الصوت جاهزاً
-            full_text = "\n\n".join([f"• {bullet}" for bullet in bullets])
-            st.markdown(full_text)
-
-            # إضافة للسجل
-            st.session_state.display_history.append({
-                "role": "user",
-                "content": user_text
-            })
-            st.session_state.display_history.append({
-                "role": "assistant",
-                "content": full_text
-            })
-
-    # عرض مشغل الصوت بعد رسالة المساعد مباشرة
-    if st.session_state.current_audio_list:
-        st.markdown("### 🔊 استمع للرد:")
-        create_sequential_audio_player(st.session_state.current_audio_list)
-
-        if len(st.session_state.current_audio_list) >= 10:
-            st.info("🎯 وصلنا لحد معلومات كافية (10 نقاط)! هل تريد السؤال عن موضوع آخر؟")
-
-    # إنهاء المعالجة
-    st.session_state.pending_query = None
-    st.session_state.query_source = None
-    st.session_state.processing = False
+if st.session_state.pending_query:
+    # كل سؤال مهمة قابلة للإلغاء: مقاطعة التشغيل (مسح المحادثة، موضوع جديد، إغلاق الصفحة)
+    # تلغي طلباته المتبقية عند Gemini وتحويل الصوت وتُهمل نتائجه الجزئية.
+    # Streamlit لا يقاطع السكربت إلا عند استدعاء st التالي: في البث يحدث ذلك مع كل
+    # نقطة فيتوقف الرد وتحويل باقي النقاط، أما بدون بث فالخيط ينتظر داخل طلب Gemini
+    # ثم داخل تحويل النقاط، فالإلغاء يصل بعد انتهاء كل منهما ولا يوفّر إلا المرحلة التالية
+    query_token = CancelToken()
+    st.session_state.query_token = query_token
+    history_before = list(st.session_state.chat_session.history)
+    query_done = False
+    query_started = time.perf_counter()
+    try:
+        with cancel_scope(query_token):
+            user_text = st.session_state.pending_query
+
+            # عرض رسالة المستخدم (إلا إذا عُرضت للتو بعد تحويل الصوت)
+            if not user_bubble_rendered:
+                with st.chat_message("user"):
+                    st.markdown(user_text)
+
+            # عرض حالة المعالجة
+            with st.chat_message("assistant"):
+                # تلخيص الأدوار القديمة إذا تجاوز السجل ميزانية التوكنات
+                manage_chat_history()
+
+                # السؤال الأول يُخدم من ذاكرة الإجابات أو من طلب مطابق جارٍ في جلسة أخرى،
+                # وإلا يُرسل لـ Gemini (راجع assistant.engine.answer_question)
+                answer, answer_rendered = answer_with_gemini(user_text)
+                bullets = answer.bullets if answer is not None else []
+                audio_ids = answer.audio_ids if answer is not None else []
+
+                # الجلسة تحفظ معرّفات المقاطع فقط، والبايتات في المخزن المشترك
+                st.session_state.current_audio_ids = audio_ids
+                audio_report = session_audio_report(audio_ids)
+                metrics.observe_size("session_audio_state", audio_report["state_bytes"])
+                metrics.observe_size("session_audio_referenced", audio_report["referenced_bytes"])
+
+                if bullets:
+                    # الآن نعرض النص بعد أن أصبح الصوت جاهزاً
+                    full_text = "\n\n".join([f"• {bullet}" for bullet in bullets])
+                    if not answer_rendered:
+                        st.markdown(full_text)
+
+                    # إضافة للسجل
+                    st.session_state.display_history.append({
+                        "role": "user",
+                        "content": user_text
+                    })
+                    st.session_state.display_history.append({
+                        "role": "assistant",
+                        "content": full_text
+                    })
+
+            # عرض مشغل الصوت بعد رسالة المساعد مباشرة
+            if st.session_state.current_audio_ids:
+                st.markdown("### 🔊 استمع للرد:")
+                with metrics.timed("player_render"):
+                    create_sequential_audio_player(st.session_state.current_audio_ids)
+                # زمن السؤال حتى يصبح الصوت قابلاً للتشغيل فعلاً في المتصفح
+                metrics.observe("first_audio", time.perf_counter() - query_started)
+
+                if len(st.session_state.current_audio_ids) >= 10:
+                    st.info("🎯 وصلنا لحد معلومات كافية (10 نقاط)! هل تريد السؤال عن موضوع آخر؟")
+
+            # إنهاء المعالجة
+            st.session_state.pending_query = None
+            st.session_state.query_source = None
+            st.session_state.processing = False
+        st.session_state.query_token = None
+        query_done = True
+    except QueryCancelled:
+        pass
+    finally:
+        if not query_done:
+            query_token.cancel()
+            restore_history(st.session_state.chat_session, history_before)
 
     # st.rerun() # --- !! تم حذف هذا السطر !! ---
     # هذا هو التعديل الرئيسي. بحذف هذا السطر،
@@ -497,10 +616,19 @@ if not st.session_state.processing:
     btn_col1, btn_col2 = st.columns(2)
 
     with btn_col1:
-        new_topic_btn = st.button("🔄 موضوع جديد", use_container_width=True, key="new_topic_main")
+        new_topic_btn = st.button(
+            "🔄 موضوع جديد", use_container_width=True, key="new_topic_main", on_click=cancel_active_query
+        )
 
     with btn_col2:
-        clear_chat_btn = st.button("🗑️ مسح المحادثة", use_container_width=True, key="clear_chat_main")
+        clear_chat_btn = st.button(
+            "🗑️ مسح المحادثة", use_container_width=True, key="clear_chat_main", on_click=cancel_active_query
+        )
+
+    # حجم السياق الذي سيُرسل مع السؤال التالي
+    if st.session_state.is_active_chat:
+        context_size = context_report(st.session_state.chat_session.history)
+        st.caption(f"📏 حجم سياق المحادثة: ~{context_size['tokens']} توكن")
 
     # التحقق من أن التسجيل جديد وليس نفس التسجيل السابق
     current_audio_len = len(audio_bytes) if audio_bytes else 0
@@ -514,15 +642,15 @@ if not st.session_state.processing:
         st.session_state.last_audio_len = current_audio_len
         st.session_state.processing = True
 
-        user_text = transcribe_audio(audio_bytes)
-
-        if "خطأ" in user_text or "لم أستطع" in user_text:
-            st.error(user_text)
+        # التحويل يبدأ الآن في الخلفية، وإعادة التشغيل تعرض حالته بدلاً من الانتظار هنا
+        try:
+            st.session_state.transcription = start_transcription(audio_bytes)
+        except (BackendBusyError, QueryCancelled) as e:
+            # الطلب لم يُجدول أصلاً، فلا تبقى الجلسة معلّقة في انتظار نتيجة لن تصل
             st.session_state.processing = False
+            st.error(f"تعذر بدء تحويل الصوت إلى نص: {e}")
         else:
-            st.session_state.is_active_chat = True
-            st.session_state.current_audio_list = []
-            st.session_state.pending_query = user_text
+            st.session_state.current_audio_ids = []
             st.session_state.query_source = 'audio'
             st.rerun()
 
@@ -531,27 +659,29 @@ if not st.session_state.processing:
         st.session_state.processing = True
         st.session_state.last_text_input = text_input
         st.session_state.is_active_chat = True
-        st.session_state.current_audio_list = []
+        st.session_state.current_audio_ids = []
         st.session_state.pending_query = text_input
         st.session_state.query_source = 'text'
         st.rerun()
 
     # معالجة الأزرار
     if new_topic_btn:
-        st.session_state.current_audio_list = []
+        st.session_state.current_audio_ids = []
         st.session_state.processing = False
         st.success("تمام! اسأل سؤالك الجديد 🎤")
 
     if clear_chat_btn:
         st.session_state.chat_session = model.start_chat(history=[])
         st.session_state.display_history = []
-        st.session_state.current_audio_list = []
+        st.session_state.current_audio_ids = []
         st.session_state.is_active_chat = False
         st.session_state.processing = False
         st.session_state.pending_query = None
         st.session_state.query_source = None
+        st.session_state.transcription = None
         st.session_state.last_audio_len = 0
         st.session_state.last_text_input = ""
+        st.session_state.history_visible = HISTORY_PAGE_SIZE
         st.rerun()
 
 else:
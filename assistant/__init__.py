@@ -0,0 +1 @@
+"""الوحدات المشتركة بين app.py و app_1.py (خط معالجة الأسئلة والصوت)"""
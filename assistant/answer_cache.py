@@ -0,0 +1,250 @@
+"""ذاكرة مؤقتة لإجابات الأسئلة الأولى (بدون سجل محادثة سابق)"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+# الحد الأقصى لعدد الإجابات المخزنة
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "500"))
+
+# مدة صلاحية الإجابة بالثواني
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(24 * 60 * 60)))
+
+# حد التشابه للأسئلة شبه المتطابقة (0 = معطّل، وهو الافتراضي)
+# أسماء الفراعنة تختلف أحياناً في الترتيب فقط (رمسيس الثاني/الثالث)، لذلك حتى
+# عند تفعيله يجب أن تتطابق كلمات السؤال غير الشائعة تماماً
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0"))
+
+# مجلد اختياري على القرص تشترك فيه العمليات (التطبيق والتسخين اليدوي) وتبقى فيه
+# الإجابات بعد إعادة التشغيل؛ مقاطعها نفسها في مخزن الصوت (AUDIO_STATIC_DIR)
+ANSWER_CACHE_DIR = os.environ.get("ANSWER_CACHE_DIR") or None
+
+_DIACRITICS_RE = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_NGRAM_SIZE = 3
+
+# كلمات السؤال التي لا تغيّر موضوعه (بعد التوحيد)
+_STOPWORDS = {
+    "من", "هو", "هي", "ما", "ماذا", "مين", "ايه", "هل", "عن", "في", "الي", "علي",
+    "كان", "كانت", "متي", "اين", "فين", "كيف", "ازاي", "لماذا", "ليه", "احكي", "احكيلي",
+    "قل", "قولي", "لي", "عرفني", "اخبرني", "حدثني", "الذي", "التي", "اللي", "و", "يا",
+}
+
+
+def normalize_arabic(text):
+    """توحيد النص العربي: إزالة التشكيل والتطويل وتوحيد الألف والياء والتاء المربوطة"""
+    text = _DIACRITICS_RE.sub("", text)
+    text = text.replace("\u0640", "")
+    text = re.sub("[إأآٱ]", "ا", text)
+    text = text.replace("ى", "ي")
+    text = text.replace("ة", "ه")
+    text = _PUNCTUATION_RE.sub(" ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def content_tokens(text):
+    """كلمات السؤال الموحّد بدون الكلمات الشائعة (الاسم والترتيب والأرقام تبقى)"""
+    return frozenset(token for token in text.split() if token not in _STOPWORDS)
+
+
+def char_ngrams(text, n=_NGRAM_SIZE):
+    """مجموعة n-gram حرفية للنص الموحّد"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class CachedAnswer(NamedTuple):
+    question: str
+    bullets: list
+    audio_ids: list
+    created_at: float
+
+
+class AnswerCache:
+    """بحث مطابق على النص الموحّد مع بحث تقريبي اختياري بتشابه n-gram
+
+    مع disk_dir تُحفظ كل إجابة في ملف JSON أيضاً: تُحمّل الإجابات الموجودة
+    عند الإنشاء، ويُبحث في الملفات عند عدم وجود السؤال في الذاكرة حتى تصل
+    الإجابات التي أضافتها عملية أخرى بعد ذلك.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL,
+                 similarity=ANSWER_CACHE_SIMILARITY, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._ngrams = {}
+        self._index = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk()
+
+    def get(self, question):
+        """إرجاع الإجابة المخزنة (النقاط والصوت) أو None"""
+        key = normalize_arabic(question)
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is not None:
+                self._add(key, entry)
+                self.disk_hits += 1
+                return entry
+
+            if self.similarity > 0:
+                similar_key = self._find_similar(key)
+                if similar_key is not None:
+                    entry = self._get_fresh(similar_key)
+                    if entry is not None:
+                        self.near_hits += 1
+                        return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, question, bullets, audio_ids):
+        """حفظ إجابة سؤال أول مع معرّفات مقاطعها في مخزن الصوت"""
+        key = normalize_arabic(question)
+        if not key:
+            return
+        entry = CachedAnswer(question, list(bullets), list(audio_ids), time.time())
+        with self._lock:
+            self._add(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self):
+        """عدادات الإصابة والإخفاق"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+    def _add(self, key, entry):
+        self._remove(key)
+        self._entries[key] = entry
+        grams = char_ngrams(key)
+        self._ngrams[key] = grams
+        for gram in grams:
+            self._index.setdefault(gram, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _find_similar(self, key):
+        grams = char_ngrams(key)
+        shared = {}
+        for gram in grams:
+            for candidate in self._index.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        tokens = content_tokens(key)
+        best_key, best_score = None, 0.0
+        for candidate, count in shared.items():
+            # التشابه الحرفي وحده يخلط بين "رمسيس الثاني" و"رمسيس الثالث"
+            if content_tokens(candidate) != tokens:
+                continue
+            # معامل Dice بين مجموعتي n-gram
+            score = 2 * count / (len(grams) + len(self._ngrams[candidate]))
+            if score > best_score:
+                best_key, best_score = candidate, score
+        return best_key if best_score >= self.similarity else None
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        for gram in self._ngrams.pop(key, ()):
+            keys = self._index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[gram]
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        return self._read_file(self._disk_path(key))
+
+    def _read_file(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = CachedAnswer(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        if time.time() - entry.created_at > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        try:
+            # الكتابة في ملف مؤقت ثم إعادة التسمية حتى لا تقرأ عملية أخرى ملفاً ناقصاً
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry._asdict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            pass
+
+    def _load_disk(self):
+        # الأحدث يُضاف أخيراً فيبقى عند تجاوز max_entries
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                entry = self._read_file(os.path.join(self.disk_dir, name))
+                if entry is not None:
+                    entries.append(entry)
+        with self._lock:
+            for entry in sorted(entries, key=lambda entry: entry.created_at):
+                self._add(normalize_arabic(entry.question), entry)
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """ذاكرة الإجابات المشتركة على مستوى العملية"""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(disk_dir=ANSWER_CACHE_DIR)
+        return _answer_cache
@@ -0,0 +1,157 @@
+"""ذاكرة تخزين مؤقت للصوت المولَّد، مفهرسة بمحتوى النص"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# الحد الأقصى لحجم الذاكرة المؤقتة في الذاكرة (بالبايت)
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# مجلد التخزين على القرص (اختياري) ليبقى الصوت بعد إعادة التشغيل
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR") or None
+
+
+def normalize_text(text):
+    """توحيد المسافات حتى تتطابق النصوص المتماثلة"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text, lang="ar", slow=False, engine="gtts", audio_format="mp3"):
+    """مفتاح ثابت لـ (النص الموحّد، اللغة، البطء، محرك الصوت، صيغة الترميز)"""
+    # الصيغة الافتراضية لا تدخل المفتاح حتى تبقى المفاتيح المحفوظة سابقاً صالحة
+    if audio_format != "mp3":
+        engine = f"{engine}:{audio_format}"
+    raw = f"{engine}\x00{lang}\x00{int(bool(slow))}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """ذاكرة LRU محدودة بعدد البايتات مع طبقة اختيارية على القرص
+
+    بشكل افتراضي تُوزّع الملفات على مجلدات فرعية حسب أول حرفين من المفتاح
+    بامتداد .mp3، ومع sharded=False تُحفظ باسم المفتاح كما هو مباشرة في disk_dir.
+    """
+
+    def __init__(self, max_bytes=TTS_CACHE_MAX_BYTES, disk_dir=None, sharded=True):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.sharded = sharded
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """إرجاع الصوت المخزن أو None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, data)
+        return data
+
+    def put(self, key, data):
+        """حفظ الصوت في الذاكرة وعلى القرص إن كان مفعّلاً"""
+        if not data:
+            return
+        with self._lock:
+            self._store(key, data)
+        self._write_disk(key, data)
+
+    def contains(self, key):
+        """هل المفتاح موجود في الذاكرة أو على القرص (بدون تعديل العدادات)"""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(key))
+
+    def stats(self):
+        """عدادات الإصابة والإخفاق والإخلاء"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        """تفريغ طبقة الذاكرة فقط"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _store(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        if not self.sharded:
+            return os.path.join(self.disk_dir, key)
+        return os.path.join(self.disk_dir, key[:2], f"{key}.mp3")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # الكتابة في ملف مؤقت ثم إعادة التسمية حتى لا يُقرأ ملف ناقص
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """الذاكرة المؤقتة المشتركة على مستوى العملية"""
+    global _audio_cache
+    with _audio_cache_lock:
+        if _audio_cache is None:
+            _audio_cache = AudioCache(TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR)
+        return _audio_cache
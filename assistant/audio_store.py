@@ -0,0 +1,251 @@
+"""مخزن مقاطع الصوت المشترك بين الجلسات، مفهرس ببصمة المحتوى ويُقدَّم كروابط ثابتة
+
+تحفظ الجلسات معرّفات المقاطع فقط (مثل "<sha256>.mp3") بدلاً من البايتات، فالمقاطع
+المتطابقة بين المستخدمين تُخزَّن مرة واحدة. الطبقة في الذاكرة محدودة بعدد البايتات
+مع إخلاء LRU، والملفات في مجلد static تبقى لتقديمها للمتصفح ولإعادة تحميلها عند الحاجة
+في حدود ميزانية على القرص: كل استخدام لمقطع يحدّث mtime لملفه، وتُحذف الملفات الأقدم
+استخداماً عند تجاوز الميزانية.
+
+يحدد Streamlit (منذ 1.56) نوع ملفات static من امتدادها عبر mimetypes ويدعم
+طلبات Range، فيشغّل المتصفح المقاطع ويتنقل داخلها مباشرة.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+from assistant import metrics
+from assistant.audio_cache import AudioCache
+from assistant.audio_workers import get_audio_workers
+from assistant.encoding import get_audio_format, mime_for_clip, transcode_speech
+from assistant.mp3_concat import SINGLE_AUDIO_STREAM, concat_mp3
+
+# Streamlit يقدّم مجلد static بجوار ملف التطبيق على المسار app/static
+# (يتطلب server.enableStaticServing = true في .streamlit/config.toml)
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUDIO_STATIC_DIR = os.environ.get("AUDIO_STATIC_DIR") or os.path.join(_APP_DIR, "static", "audio")
+AUDIO_BASE_URL = os.environ.get("AUDIO_BASE_URL", "./app/static/audio")
+
+# بعض ملفات mime.types في الأنظمة تربط .ogg بـ application/ogg، والمتصفح مع nosniff
+# لا يشغّل إلا نوع صوت صحيح
+mimetypes.add_type("audio/mpeg", ".mp3")
+mimetypes.add_type("audio/ogg", ".ogg")
+
+# الحد الأقصى لبايتات المقاطع المحفوظة في الذاكرة لكل العملية
+AUDIO_STORE_MAX_BYTES = int(os.environ.get("AUDIO_STORE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# ميزانية ملفات المقاطع في مجلد static على القرص (0 = بدون حد)
+AUDIO_STATIC_MAX_BYTES = int(os.environ.get("AUDIO_STATIC_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# الملفات المستخدمة خلال هذه المدة (بالثواني) لا تُحذف لأن مشغلاً مفتوحاً قد يطلبها
+AUDIO_STATIC_MIN_AGE = float(os.environ.get("AUDIO_STATIC_MIN_AGE", "3600"))
+
+# صيغة النسخة الاحتياطية للمقاطع غير MP3 (Opus لا يعمل في Safari)
+AUDIO_FALLBACK_FORMAT = "mp3-low"
+
+# فحص المجلد بعد كتابة هذا القدر من البايتات منذ آخر تنظيف
+_PRUNE_EVERY_BYTES = max(AUDIO_STATIC_MAX_BYTES // 20, 1)
+
+_clip_store = None
+_clip_store_lock = threading.Lock()
+_written_since_prune = 0
+_prune_lock = threading.Lock()
+
+
+def get_clip_store():
+    """مخزن المقاطع المشترك على مستوى العملية"""
+    global _clip_store
+    with _clip_store_lock:
+        if _clip_store is None:
+            _clip_store = AudioCache(AUDIO_STORE_MAX_BYTES, AUDIO_STATIC_DIR, sharded=False)
+            # الملفات المتبقية من تشغيل سابق تدخل الميزانية من البداية
+            prune_audio_files(_clip_store.disk_dir)
+        return _clip_store
+
+
+def set_clip_store(store):
+    """استبدال مخزن المقاطع المشترك (مثلاً بمجلد مؤقت عند قياس الأداء)"""
+    global _clip_store
+    with _clip_store_lock:
+        _clip_store = store
+
+
+def audio_id(data, ext="mp3"):
+    """معرّف المقطع: بصمة sha256 لمحتواه مع الامتداد"""
+    return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+def audio_url(clip_id):
+    """رابط المقطع كما يراه المتصفح"""
+    return f"{AUDIO_BASE_URL}/{clip_id}"
+
+
+def store_audio(data, ext=None):
+    """حفظ المقطع مرة واحدة فقط (المقاطع المتطابقة تشترك في نفس الملف) وإرجاع معرّفه
+
+    الامتداد الافتراضي هو امتداد الصيغة المختارة في AUDIO_FORMAT.
+    """
+    clip_id = audio_id(data, ext or get_audio_format().ext)
+    store = get_clip_store()
+    if not _touch(store, clip_id):
+        store.put(clip_id, data)
+        _count_written(store, len(data))
+    return clip_id
+
+
+def keep_audio(clip_ids):
+    """تعليم المقاطع كمستخدمة الآن حتى لا تُحذف، وإعادة كتابة ما حُذف ملفه وبقي في الذاكرة
+
+    ترجع False إذا لم يعد أحد المقاطع موجوداً (فيجب توليده من جديد).
+    """
+    store = get_clip_store()
+    for clip_id in clip_ids:
+        if _touch(store, clip_id):
+            continue
+        data = store.get(clip_id)
+        if data is None:
+            return False
+        store.put(clip_id, data)
+        _count_written(store, len(data))
+    return True
+
+
+def prune_audio_files(disk_dir, max_bytes=AUDIO_STATIC_MAX_BYTES, min_age=AUDIO_STATIC_MIN_AGE):
+    """حذف الملفات الأقدم استخداماً (حسب mtime) حتى يرجع المجلد تحت max_bytes
+
+    ترجع (عدد الملفات المحذوفة، البايتات المحررة).
+    """
+    if max_bytes <= 0:
+        return 0, 0
+    files = []
+    total = 0
+    try:
+        with os.scandir(disk_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+                except OSError:
+                    pass
+    except OSError:
+        return 0, 0
+
+    removed = freed = 0
+    cutoff = time.time() - min_age
+    for mtime, size, path in sorted(files):
+        if total <= max_bytes or mtime > cutoff:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+    metrics.inc("audio_files_pruned_total", removed)
+    metrics.inc("audio_files_pruned_bytes_total", freed)
+    return removed, freed
+
+
+def _touch(store, clip_id):
+    # mtime هو وقت آخر استخدام للمقطع، ويرجع False إذا لم يعد الملف موجوداً
+    try:
+        os.utime(os.path.join(store.disk_dir, clip_id))
+        return True
+    except OSError:
+        return False
+
+
+def _count_written(store, size):
+    global _written_since_prune
+    with _prune_lock:
+        _written_since_prune += size
+        if _written_since_prune < _PRUNE_EVERY_BYTES:
+            return
+        _written_since_prune = 0
+    prune_audio_files(store.disk_dir)
+
+
+def fallback_clip_id(clip_id):
+    """معرّف نسخة MP3 الاحتياطية لمقطع بصيغة أخرى"""
+    return f"{clip_id.rsplit('.', 1)[0]}.fallback.mp3"
+
+
+def _ensure_fallback(store, clip_id, owner):
+    # تُنشأ مرة واحدة لكل مقطع عند أول عرض له، ثم يكفي تحديث وقت استخدامها
+    fallback_id = fallback_clip_id(clip_id)
+    if _touch(store, fallback_id):
+        return fallback_id
+    data = store.get(fallback_id)
+    if data is None:
+        audio = load_audio(clip_id)
+        if audio is None:
+            return None
+        try:
+            data = get_audio_workers().run(
+                transcode_speech, audio, get_audio_format(AUDIO_FALLBACK_FORMAT), owner=owner
+            )
+        except Exception:
+            metrics.inc("audio_fallback_errors_total")
+            return None
+    store.put(fallback_id, data)
+    _count_written(store, len(data))
+    return fallback_id
+
+
+def load_audio(clip_id):
+    """بايتات المقطع من الذاكرة أو من ملفه، أو None إذا لم يعد موجوداً"""
+    return get_clip_store().get(clip_id)
+
+
+def session_audio_report(clip_ids):
+    """ذاكرة الصوت الخاصة بجلسة: ما تحفظه فعلاً (المعرّفات) وحجم المقاطع المشتركة التي تشير إليها"""
+    store = get_clip_store()
+    referenced = 0
+    for clip_id in set(clip_ids):
+        try:
+            referenced += os.path.getsize(os.path.join(store.disk_dir, clip_id))
+        except OSError:
+            pass
+    return {
+        "clips": len(clip_ids),
+        "state_bytes": sum(len(clip_id) for clip_id in clip_ids),
+        "referenced_bytes": referenced,
+    }
+
+
+def prepare_player_sources(clip_ids, single_stream=SINGLE_AUDIO_STREAM, owner=None):
+    """إرجاع (مصادر المقاطع، بدايات النقاط داخل الملف الواحد)
+
+    لكل مقطع قائمة [الرابط، نوع MIME] بالأفضلية: المقطع نفسه ثم نسخة MP3
+    احتياطية إن لم يكن MP3، فيختار المشغل أول ما يقبله canPlayType.
+    عند single_stream تُدمج إطارات MP3 في ملف واحد متصل (بدون إعادة ترميز)
+    وتكون قائمة البدايات غير فارغة، وإلا تُرجع المقاطع المنفصلة.
+    الدمج والنسخ الاحتياطية تجري في مجمع عمليات الصوت حتى لا تمسك GIL خيط الواجهة.
+    """
+    clip_ids = [clip_id for clip_id in clip_ids[:10] if clip_id]
+    keep_audio(clip_ids)
+
+    chapters = []
+    # الدمج بدون إعادة ترميز ممكن لإطارات MP3 فقط
+    if single_stream and clip_ids and all(clip_id.endswith(".mp3") for clip_id in clip_ids):
+        clips = [load_audio(clip_id) for clip_id in clip_ids]
+        joined, chapters = get_audio_workers().run(concat_mp3, [clip for clip in clips if clip], owner=owner)
+        if joined:
+            clip_ids = [store_audio(joined, ext="mp3")]
+        else:
+            chapters = []
+
+    store = get_clip_store()
+    sources = []
+    for clip_id in clip_ids:
+        candidates = [[audio_url(clip_id), mime_for_clip(clip_id)]]
+        if not clip_id.endswith(".mp3"):
+            fallback_id = _ensure_fallback(store, clip_id, owner)
+            if fallback_id is not None:
+                candidates.append([audio_url(fallback_id), mime_for_clip(fallback_id)])
+        sources.append(candidates)
+    return sources, chapters
@@ -0,0 +1,79 @@
+"""مجمع عمليات مشترك لمعالجة الصوت الثقيلة على المعالج (تحويل القنوات ودمج MP3)
+
+معالجة الصوت بلغة Python تمسك GIL فتوقف كل الجلسات الأخرى في نفس الخادم؛
+لذلك تُرسل إلى عمليات منفصلة تتوزع على أنوية المعالج. كل مهمة يمكن أن تحمل
+مالكاً (معرّف الجلسة) لإلغاء مهامه المنتظرة عند مسح المحادثة.
+"""
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+
+# عدد عمليات معالجة الصوت (0 = التنفيذ في نفس الخيط بدون عمليات)
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class AudioWorkerPool:
+    """طابور مهام الصوت فوق ProcessPoolExecutor مع إلغاء حسب المالك"""
+
+    def __init__(self, max_workers=AUDIO_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn وليس fork: خادم Streamlit متعدد الخيوط ونسخه بـ fork غير آمن
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    def submit(self, func, *args, owner=None):
+        """جدولة func(*args) في عملية منفصلة وإرجاع Future (يجب أن تكون func دالة على مستوى الوحدة)"""
+        if self.max_workers <= 0:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with self._lock:
+            future = self._get_executor().submit(func, *args)
+            self._jobs[future] = owner
+        future.add_done_callback(self._forget)
+        return future
+
+    def run(self, func, *args, owner=None):
+        """مثل submit لكن ينتظر النتيجة"""
+        return self.submit(func, *args, owner=owner).result()
+
+    def _forget(self, future):
+        with self._lock:
+            self._jobs.pop(future, None)
+
+    def cancel(self, owner):
+        """إلغاء مهام المالك التي لم تبدأ بعد وإرجاع عددها"""
+        with self._lock:
+            owned = [future for future, job_owner in self._jobs.items() if job_owner == owner]
+        return sum(1 for future in owned if future.cancel())
+
+    def stats(self):
+        """عدد المهام المنتظرة والجارية"""
+        with self._lock:
+            futures = list(self._jobs)
+        running = sum(1 for future in futures if future.running())
+        return {"queued": len(futures) - running, "running": running, "workers": self.max_workers}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_audio_workers():
+    """مجمع عمليات الصوت المشترك على مستوى العملية"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AudioWorkerPool()
+        return _pool
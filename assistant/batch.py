@@ -0,0 +1,125 @@
+"""الإجابة على ملف أسئلة دفعة واحدة بدون واجهة وحفظ النصوص والمقاطع
+
+الاستخدام:
+    python -m assistant.batch questions.jsonl --output-dir out --concurrency 4 --rate 2
+
+كل سطر في الملف كائن JSON بنفس شكل requests.jsonl: يُقرأ السؤال من "question"
+أو "body" أو "title"، والمعرّف من "id" أو "request_id" (وإلا رقم السطر).
+ينتج لكل سؤال مجلد فيه answer.json و 01.mp3 و 02.mp3 ...، وملف results.jsonl للكل.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from assistant.audio_store import load_audio
+from assistant.engine import answer_question
+from assistant.gemini import create_model, load_api_key
+from assistant.rate_limit import TokenBucket
+from assistant.request_engine import PRIORITY_BACKGROUND, with_priority
+
+
+def read_questions(path):
+    """قراءة (المعرّف، السؤال) من ملف JSONL"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            question = item.get("question") or item.get("body") or item.get("title")
+            if not question:
+                continue
+            question_id = str(item.get("id") or item.get("request_id") or line_number)
+            questions.append((question_id, question))
+    return questions
+
+
+def _safe_name(question_id):
+    return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in question_id)
+
+
+def process_question(model, question_id, question, output_dir, limiter):
+    """الإجابة على سؤال واحد وكتابة نتائجه"""
+    delay = limiter.reserve()
+    if delay > 0:
+        time.sleep(delay)
+    started = time.perf_counter()
+    answer = answer_question(model, question)
+
+    question_dir = os.path.join(output_dir, _safe_name(question_id))
+    os.makedirs(question_dir, exist_ok=True)
+
+    audio_files = []
+    for index, clip_id in enumerate(answer.audio_ids, start=1):
+        audio = load_audio(clip_id)
+        if audio is None:
+            continue
+        file_name = f"{index:02d}.{clip_id.rsplit('.', 1)[-1]}"
+        with open(os.path.join(question_dir, file_name), "wb") as f:
+            f.write(audio)
+        audio_files.append(file_name)
+
+    record = {
+        "id": question_id,
+        "question": question,
+        "bullets": answer.bullets,
+        "audio_files": audio_files,
+        "errors": [str(error) for error in answer.errors],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(question_dir, "answer.json"), "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    return record
+
+
+def run_batch(questions, output_dir, concurrency=4, rate=1.0, model=None):
+    """معالجة الأسئلة بالتوازي مع حد للمعدل، وإرجاع سجل لكل سؤال"""
+    model = model or create_model(load_api_key())
+    # رمز واحد في الدلو: الأسئلة تبدأ متباعدة بمعدل rate بلا دفعات
+    limiter = TokenBucket(rate, burst=1)
+    os.makedirs(output_dir, exist_ok=True)
+
+    records = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(
+                with_priority, PRIORITY_BACKGROUND, process_question, model, question_id, question, output_dir, limiter
+            ): question_id
+            for question_id, question in questions
+        }
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            question_id = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {"id": question_id, "error": str(e)}
+            records.append(record)
+            status = "خطأ" if record.get("error") or record.get("errors") else "تم"
+            print(f"[{done_count}/{len(futures)}] {question_id}: {status}", file=sys.stderr)
+
+    with open(os.path.join(output_dir, "results.jsonl"), "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="الإجابة على ملف أسئلة وحفظ النصوص والمقاطع الصوتية")
+    parser.add_argument("questions", help="ملف JSONL بالأسئلة")
+    parser.add_argument("--output-dir", default="batch_output", help="مجلد النتائج")
+    parser.add_argument("--concurrency", type=int, default=4, help="عدد الأسئلة المعالجة بالتوازي")
+    parser.add_argument("--rate", type=float, default=1.0, help="أقصى عدد أسئلة تبدأ في الثانية (0 بلا حد)")
+    args = parser.parse_args(argv)
+
+    records = run_batch(read_questions(args.questions), args.output_dir, args.concurrency, args.rate)
+    failed = sum(1 for record in records if record.get("error") or record.get("errors"))
+    print(f"انتهى: {len(records) - failed} ناجح، {failed} به أخطاء", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""مرحلة اختيارية لإعادة ترميز الكلام بصيغة مضغوطة (MP3 منخفض المعدل أو Opus) عبر ffmpeg
+
+الكلام لا يحتاج معدل البت الافتراضي لمحرك الصوت؛ قناة واحدة بـ 24-32 kbps
+تكفي وتقلل حجم الذاكرة المؤقتة والمخزن وما يُنقل للمتصفح. الصيغة الافتراضية
+mp3 تُبقي الصوت كما خرج من المحرك. Opus في Ogg لا تشغّله نسخ Safari القديمة.
+"""
+import mimetypes
+import os
+import shutil
+import subprocess
+from typing import NamedTuple, Optional
+
+# صيغة المقاطع: mp3 (كما هي) أو mp3-low أو opus
+AUDIO_FORMAT = os.environ.get("AUDIO_FORMAT", "mp3")
+
+# معدل البت ومعدل العينات عند إعادة الترميز
+AUDIO_BITRATE = os.environ.get("AUDIO_BITRATE", "32k")
+AUDIO_SAMPLE_RATE = os.environ.get("AUDIO_SAMPLE_RATE", "24000")
+
+
+class AudioFormat(NamedTuple):
+    name: str
+    ext: str
+    mime: str
+    # وسائط ffmpeg للترميز (None = بدون إعادة ترميز)
+    codec_args: Optional[list]
+
+
+AUDIO_FORMATS = {
+    "mp3": AudioFormat("mp3", "mp3", "audio/mpeg", None),
+    "mp3-low": AudioFormat("mp3-low", "mp3", "audio/mpeg", ["-codec:a", "libmp3lame", "-f", "mp3"]),
+    "opus": AudioFormat(
+        "opus", "ogg", "audio/ogg; codecs=opus",
+        ["-codec:a", "libopus", "-application", "voip", "-f", "ogg"],
+    ),
+}
+
+# النوع المعلن لكل امتداد (مع الترميز، مثل codecs=opus) حتى يحكم canPlayType بدقة
+_EXTENSION_MIME = {
+    "webm": "audio/webm",
+    **{audio_format.ext: audio_format.mime for audio_format in AUDIO_FORMATS.values()},
+}
+
+
+def get_audio_format(name=None):
+    """الصيغة المختارة في الإعدادات (AUDIO_FORMAT)"""
+    name = name or AUDIO_FORMAT
+    try:
+        return AUDIO_FORMATS[name]
+    except KeyError:
+        raise ValueError(f"صيغة صوت غير معروفة: {name} (المتاح: {', '.join(AUDIO_FORMATS)})")
+
+
+def mime_for_clip(clip_id):
+    """نوع MIME للمقطع من امتداد معرّفه أو رابطه كما تعلنه صيغته في AUDIO_FORMATS"""
+    ext = clip_id.rsplit(".", 1)[-1].lower()
+    return _EXTENSION_MIME.get(ext) or mimetypes.guess_type(clip_id)[0] or "audio/mpeg"
+
+
+def transcode_speech(audio, audio_format, bitrate=AUDIO_BITRATE, sample_rate=AUDIO_SAMPLE_RATE):
+    """إعادة ترميز مقطع الكلام إلى الصيغة المطلوبة بقناة واحدة"""
+    if audio_format.codec_args is None or not audio:
+        return audio
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg غير مثبت على الخادم")
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(sample_rate), "-b:a", bitrate,
+         *audio_format.codec_args, "pipe:1"],
+        input=audio, check=True, capture_output=True,
+    ).stdout
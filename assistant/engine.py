@@ -0,0 +1,238 @@
+"""خط معالجة السؤال بدون Streamlit: Gemini ثم استخراج النقاط ثم تحويلها إلى صوت"""
+import functools
+import queue
+import threading
+import time
+from typing import NamedTuple
+
+from assistant import metrics
+from assistant.answer_cache import get_answer_cache, normalize_arabic
+from assistant.audio_store import keep_audio, store_audio
+from assistant.history import remember_exchange
+from assistant.request_engine import QueryCancelled, current_cancel_token, get_request_engine
+from assistant.single_flight import SingleFlight
+from assistant.speech_units import join_speech_units, split_speech_units
+from assistant.streaming import extract_bullet_points, iter_stream_bullets
+from assistant.tts import cached_synthesize_speech
+from assistant.tts_pipeline import collect_synthesis, start_synthesis, synthesize_all
+
+# الحد الأقصى للنقاط التي تتحول إلى صوت في كل رد
+MAX_AUDIO_BULLETS = 10
+
+# الأسئلة الأولى المتطابقة في نفس اللحظة (فصل كامل يسأل نفس السؤال) تنتظر طلباً واحداً
+question_flight = SingleFlight("question", retry_errors=(QueryCancelled,))
+
+
+def question_key(question):
+    """مفتاح دمج الأسئلة المتطابقة بعد توحيد الكتابة العربية"""
+    return normalize_arabic(question)
+
+
+class Answer(NamedTuple):
+    question: str
+    response_text: str
+    bullets: list
+    audio_ids: list
+    errors: list
+    # مصدر الإجابة: gemini أو cache (ذاكرة الإجابات) أو shared (من طلب متزامن مطابق)
+    source: str = "gemini"
+
+    @property
+    def is_complete(self):
+        """الرد سليم وكل نقاطه لها صوت"""
+        return not self.errors and len(self.audio_ids) == len(self.bullets[:MAX_AUDIO_BULLETS])
+
+
+def ask_gemini(chat_session, prompt_text, **kwargs):
+    """إرسال الرسالة لـ Gemini وإرجاع نص الرد (ترفع الاستثناء عند الفشل)"""
+    with metrics.timed("gemini"):
+        response = get_request_engine().run("gemini", chat_session.send_message, prompt_text, **kwargs)
+    metrics.record_token_usage(getattr(response, "usage_metadata", None))
+    return response.text
+
+
+_STREAM_END = object()
+
+
+def stream_gemini(chat_session, prompt_text):
+    """إرسال الرسالة لـ Gemini وإرجاع نص الرد على دفعات (ترفع الاستثناء عند الفشل)
+
+    البث كله يُقرأ داخل مكان Gemini في محرك الطلبات، فيبقى ضمن حد التزامن
+    وإعادة المحاولة، وتُعاد المحاولة فقط قبل وصول أول دفعة حتى لا يتكرر نص.
+    عند الفشل يُعاد سجل الجلسة كما كان، لأن البث المنقطع يبقى معلّقاً فيها
+    وتفشل بعده كل قراءة للسجل.
+    """
+    chunks = queue.Queue()
+    token = current_cancel_token()
+    stopped = threading.Event()
+
+    def read_stream():
+        history_before = list(chat_session.history)
+        delivered = False
+        try:
+            response = chat_session.send_message(prompt_text, stream=True)
+            for chunk in response:
+                # القارئ توقف أو أُلغي السؤال: نحرر مكان Gemini فوراً
+                if stopped.is_set() or (token is not None and token.cancelled):
+                    raise QueryCancelled()
+                chunks.put(chunk.text)
+                delivered = True
+            metrics.record_token_usage(getattr(response, "usage_metadata", None))
+        except Exception as e:
+            chat_session.history = history_before
+            if not delivered:
+                raise
+            # بعد أول دفعة يصل الخطأ للقارئ بدلاً من إعادة المحاولة
+            chunks.put(e)
+
+    # زمن gemini مثل ask_gemini: من إرسال الطلب حتى اكتمال البث
+    started = time.perf_counter()
+    future = get_request_engine().submit("gemini", read_stream)
+    future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _STREAM_END:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+        future.result()
+        metrics.observe("gemini", time.perf_counter() - started)
+    finally:
+        stopped.set()
+
+
+def synthesize_bullets(bullets):
+    """تحويل النقاط إلى صوت بالتوازي وإرجاع نتائج SynthesisResult بالترتيب
+
+    النقاط الطويلة تُقسم إلى وحدات متقاربة الطول تُرسل الأطول أولاً.
+    """
+    with metrics.timed("tts_total"):
+        return synthesize_all(
+            bullets[:MAX_AUDIO_BULLETS],
+            cached_synthesize_speech,
+            split=split_speech_units,
+            join=join_speech_units,
+        )
+
+
+def answer_question(model, question, chat_session=None, use_cache=True, stream=False, on_bullet=None):
+    """تشغيل خط المعالجة كاملاً لسؤال واحد
+
+    بدون chat_session يُعامل السؤال كسؤال أول في محادثة جديدة. السؤال الأول
+    يُخدم من ذاكرة الإجابات (عند use_cache) ويُحفظ فيها الرد الكامل، والأسئلة
+    الأولى المتطابقة المتزامنة تنتظر طلباً واحداً. الإجابة التي لم تمر بـ
+    chat_session المعطاة تُضاف إلى سجلها.
+
+    مع stream يُقرأ الرد على دفعات وتُستدعى on_bullet(النقاط حتى الآن) عند
+    اكتمال كل نقطة ويبدأ تحويلها إلى صوت فوراً. فشل Gemini يُرفع كاستثناء
+    ولا يُحفظ منه شيء.
+    """
+    is_first_turn = chat_session is None or not chat_session.history
+    cache = get_answer_cache() if use_cache and is_first_turn else None
+
+    cached_answer = cache.get(question) if cache is not None else None
+    # الإجابة المخزنة لا تفيد إذا حُذفت مقاطعها من القرص
+    if cached_answer and keep_audio(cached_answer.audio_ids):
+        if chat_session is not None:
+            remember_exchange(chat_session, question, cached_answer.bullets)
+        response_text = "\n".join(f"• {bullet}" for bullet in cached_answer.bullets)
+        return Answer(
+            question, response_text, cached_answer.bullets, list(cached_answer.audio_ids), [], "cache"
+        )
+
+    own_session = chat_session is None
+    if own_session:
+        chat_session = model.start_chat(history=[])
+    answer_uncached = functools.partial(_answer_uncached, chat_session, question, cache, stream, on_bullet)
+    if cache is None:
+        return answer_uncached()
+
+    answer, shared = question_flight.do(question_key(question), answer_uncached)
+    if not shared:
+        return answer
+    if not own_session:
+        remember_exchange(chat_session, question, answer.bullets)
+    return answer._replace(source="shared")
+
+
+def _answer_uncached(chat_session, question, cache, stream, on_bullet):
+    if stream:
+        response_text, bullets, results = _stream_and_synthesize(chat_session, question, on_bullet)
+    else:
+        response_text = ask_gemini(chat_session, question)
+        with metrics.timed("extract_bullets"):
+            bullets = extract_bullet_points(response_text)
+        results = synthesize_bullets(bullets)
+
+    audio_ids, errors = [], []
+    for result in results:
+        if isinstance(result.error, QueryCancelled):
+            raise result.error
+        if result.error is not None:
+            errors.append(result.error)
+        elif result.audio:
+            audio_ids.append(store_audio(result.audio))
+
+    answer = Answer(question, response_text, bullets, audio_ids, errors)
+    if cache is not None and answer.is_complete:
+        cache.put(question, bullets, audio_ids)
+    return answer
+
+
+def _stream_and_synthesize(chat_session, question, on_bullet):
+    # كل نقطة تبدأ تحويلها إلى صوت فور اكتمالها أثناء البث
+    started = time.monotonic()
+    timings = {}
+    chunks = []
+    bullets = []
+    pending_audio = []
+
+    def on_audio_ready(_):
+        # أول مقطع جاهز على الخادم؛ المشغل نفسه يظهر بعد اكتمال كل النقاط
+        # (زمن first_audio يُسجَّل في الواجهة عند عرضه)
+        timings.setdefault("first_clip", time.monotonic() - started)
+
+    def start_bullet_audio(bullet):
+        pending = start_synthesis(bullet, cached_synthesize_speech, split=split_speech_units, join=join_speech_units)
+        pending.future.add_done_callback(on_audio_ready)
+        pending_audio.append(pending)
+
+    def recorded_chunks():
+        for chunk in stream_gemini(chat_session, question):
+            chunks.append(chunk)
+            yield chunk
+
+    try:
+        for bullet in iter_stream_bullets(recorded_chunks()):
+            timings.setdefault("first_bullet", time.monotonic() - started)
+            bullets.append(bullet)
+            if on_bullet is not None:
+                on_bullet(list(bullets))
+            if len(pending_audio) < MAX_AUDIO_BULLETS:
+                start_bullet_audio(bullet)
+    except BaseException:
+        # الرد المنقطع لا يُحوَّل إلى صوت
+        for pending in pending_audio:
+            for item in pending.items:
+                item.expire()
+        raise
+
+    response_text = "".join(chunks)
+    timings["full_answer"] = time.monotonic() - started
+
+    # نفس سلوك extract_bullet_points عندما لا توجد نقاط
+    if not bullets:
+        bullets = [response_text]
+        if on_bullet is not None:
+            on_bullet(list(bullets))
+        start_bullet_audio(response_text)
+
+    with metrics.timed("tts_total"):
+        results = collect_synthesis(pending_audio)
+    timings["all_audio"] = time.monotonic() - started
+
+    for stage, seconds in timings.items():
+        metrics.observe(f"stream_{stage}", seconds)
+    return response_text, bullets, results
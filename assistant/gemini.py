@@ -0,0 +1,61 @@
+"""إعدادات نموذج Gemini المشتركة"""
+import os
+import tomllib
+
+import google.generativeai as genai
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 2048,
+}
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+SYSTEM_INSTRUCTION = """أنت مساعد ذكي متخصص في التاريخ المصري والشخصيات التاريخية المصرية.
+
+قواعد مهمة جداً:
+1. استخدم اللغة العربية الفصحى في جميع إجاباتك
+2. اكتب إجابتك على شكل نقاط منفصلة، كل نقطة في سطر جديد
+3. كل نقطة يجب أن تكون جملة كاملة ومفيدة (جملة أو جملتين)
+4. اكتب من 3 إلى 5 نقاط فقط
+5. لا تكتب ترحيب في البداية - ابدأ مباشرة بالمعلومات
+6. ابدأ كل نقطة بـ "•" أو "-"
+
+مثال على الرد المطلوب:
+• توت عنخ آمون كان فرعوناً مصرياً حكم مصر وهو في التاسعة من عمره
+• اكتشف هوارد كارتر مقبرته عام 1922 وكانت مليئة بالكنوز الثمينة
+• تعتبر المقبرة من أهم الاكتشافات الأثرية في التاريخ
+• توفي في سن التاسعة عشرة والسبب لا يزال غامضاً
+
+تذكر: نقاط قصيرة ومفيدة باللغة العربية الفصحى!"""
+
+MODEL_NAME = "gemini-2.5-flash"
+
+
+def create_model(api_key):
+    """إعداد مفتاح Gemini وإنشاء النموذج بالإعدادات الثابتة أعلاه"""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(
+        model_name=MODEL_NAME,
+        generation_config=GENERATION_CONFIG,
+        system_instruction=SYSTEM_INSTRUCTION,
+        safety_settings=SAFETY_SETTINGS
+    )
+
+
+def load_api_key(secrets_path=".streamlit/secrets.toml"):
+    """مفتاح Gemini من متغير البيئة GEMINI_API_KEY أو من ملف أسرار Streamlit"""
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if api_key:
+        return api_key
+    try:
+        with open(secrets_path, "rb") as f:
+            return tomllib.load(f)["GEMINI_API_KEY"]
+    except (OSError, KeyError, tomllib.TOMLDecodeError):
+        raise KeyError("GEMINI_API_KEY")
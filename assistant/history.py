@@ -0,0 +1,124 @@
+"""إبقاء سجل محادثة Gemini ضمن ميزانية توكنات بتلخيص الأدوار القديمة"""
+import os
+
+# عدد الأدوار الأخيرة (سؤال + إجابة) التي تبقى كما هي
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", "4"))
+
+# الحد التقريبي لحجم السياق المرسل مع كل سؤال (بالتوكن)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000"))
+
+# أقصى طول للملخص المتراكم بالأحرف
+MAX_SUMMARY_CHARS = 2000
+
+SUMMARY_PREFIX = "ملخص المحادثة السابقة:"
+SUMMARY_ACK = "حسناً، سأراعي هذا الملخص في إجاباتي القادمة."
+
+
+def _field(content, name):
+    if isinstance(content, dict):
+        return content.get(name)
+    return getattr(content, name, None)
+
+
+def content_text(content):
+    """نص رسالة واحدة من السجل (Content أو dict)"""
+    texts = []
+    for part in _field(content, "parts") or []:
+        text = part if isinstance(part, str) else _field(part, "text")
+        if text:
+            texts.append(text)
+    return "\n".join(texts)
+
+
+def estimate_tokens(text):
+    """تقدير محلي سريع لعدد التوكنات (حوالي 3 أحرف عربية لكل توكن)"""
+    return (len(text) + 2) // 3
+
+
+def context_tokens(history):
+    """الحجم التقريبي للسجل بالتوكن"""
+    return sum(estimate_tokens(content_text(content)) for content in history)
+
+
+def context_report(history):
+    """ملخص حجم السياق الحالي للعرض والقياس"""
+    items = list(history)
+    has_summary = bool(items) and content_text(items[0]).startswith(SUMMARY_PREFIX)
+    return {
+        "tokens": context_tokens(items),
+        "turns": (len(items) - (2 if has_summary else 0)) // 2,
+        "summarized": has_summary,
+    }
+
+
+def fallback_summary(previous_summary, old_contents):
+    """ملخص محلي بسيط عند فشل التلخيص عبر النموذج: أسئلة المستخدم السابقة فقط"""
+    questions = [
+        content_text(content).strip()
+        for content in old_contents
+        if _field(content, "role") == "user"
+    ]
+    lines = [previous_summary] if previous_summary else []
+    lines += [f"- سأل المستخدم: {question}" for question in questions if question]
+    return "\n".join(lines)
+
+
+def compact_history(history, summarize, keep_turns=HISTORY_KEEP_TURNS,
+                    token_budget=HISTORY_TOKEN_BUDGET):
+    """إرجاع سجل جديد مضغوط إذا تجاوز الميزانية، أو None إذا لم يلزم التغيير
+
+    تبقى آخر keep_turns أدوار كما هي، وتُدمج الأدوار الأقدم مع الملخص السابق
+    عبر summarize(previous_summary, transcript) في ملخص واحد متجدد.
+    """
+    items = list(history)
+    if context_tokens(items) <= token_budget:
+        return None
+
+    previous_summary = ""
+    if items and content_text(items[0]).startswith(SUMMARY_PREFIX):
+        previous_summary = content_text(items[0])[len(SUMMARY_PREFIX):].strip()
+        items = items[2:]
+
+    keep = keep_turns * 2
+    if len(items) <= keep:
+        return None
+    old, recent = items[:-keep], items[-keep:]
+
+    transcript = "\n".join(
+        f"{'المستخدم' if _field(content, 'role') == 'user' else 'المساعد'}: {content_text(content)}"
+        for content in old
+    )
+    try:
+        summary = summarize(previous_summary, transcript).strip()
+    except Exception:
+        summary = ""
+    if not summary:
+        summary = fallback_summary(previous_summary, old)
+
+    return [
+        {"role": "user", "parts": [f"{SUMMARY_PREFIX}\n{summary[-MAX_SUMMARY_CHARS:]}"]},
+        {"role": "model", "parts": [SUMMARY_ACK]},
+        *[{"role": _field(content, "role"), "parts": [content_text(content)]} for content in recent],
+    ]
+
+
+def restore_history(chat_session, history):
+    """إرجاع سجل الجلسة كما كان قبل سؤال أُلغي، مع إهمال أي رد متدفق لم يكتمل
+
+    تعيين history يمسح الرسالة والرد المعلّقين في الجلسة، فلا نستدعي rewind
+    الذي يرفع IncompleteIterationError إذا لم يكتمل البث.
+    """
+    chat_session.history = history
+
+
+def remember_exchange(chat_session, question, bullets):
+    """إضافة سؤال وإجابة لم تمر بهذه الجلسة (من الذاكرة أو من طلب مشترك) إلى سجلها
+
+    حتى تبقى الأسئلة التالية في سياقها.
+    """
+    answer_text = "\n".join(f"• {bullet}" for bullet in bullets)
+    chat_session.history = [
+        *chat_session.history,
+        {"role": "user", "parts": [question]},
+        {"role": "model", "parts": [answer_text]},
+    ]
@@ -0,0 +1,241 @@
+"""قياس زمن مراحل المعالجة وتصديره بصيغة Prometheus النصية أو كسجلات JSON"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# منفذ نقطة /metrics (بدون قيمة لا يتم تشغيلها)
+METRICS_PORT = os.environ.get("METRICS_PORT")
+
+# تسجيل كل قياس كسطر JSON عبر logging (ضع 1 للتفعيل)
+METRICS_LOG = os.environ.get("METRICS_LOG", "0") == "1"
+
+# حدود فئات المدرّج التكراري بالثواني
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# حدود فئات مدرّج الأحجام بالبايت
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+logger = logging.getLogger("assistant.metrics")
+
+_lock = threading.Lock()
+_histograms = {}
+_size_histograms = {}
+_counters = {}
+_listeners = []
+_server = None
+
+
+class _Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def lines(self, name, label, value):
+        result = []
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            result.append(f'{name}_bucket{{{label}="{value}",le="{bound:g}"}} {count}')
+        result.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {self.count}')
+        result.append(f'{name}_sum{{{label}="{value}"}} {self.sum:.6f}')
+        result.append(f'{name}_count{{{label}="{value}"}} {self.count}')
+        return result
+
+
+def observe(stage, seconds):
+    """تسجيل زمن مرحلة واحدة"""
+    with _lock:
+        _histograms.setdefault(stage, _Histogram()).observe(seconds)
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(stage, seconds)
+    if METRICS_LOG:
+        logger.info(json.dumps({"metric": "stage_seconds", "stage": stage, "value": seconds}))
+
+
+def add_listener(listener):
+    """استدعاء listener(stage, seconds) مع كل زمن يُسجَّل (المدرّج لا يحفظ القيم نفسها)
+
+    يفيد قياس الأداء في حساب المئينات الدقيقة لكل مرحلة.
+    """
+    with _lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _lock:
+        _listeners.remove(listener)
+
+
+def observe_size(kind, nbytes):
+    """تسجيل حجم بالبايت (مثل ذاكرة الصوت لكل جلسة)"""
+    with _lock:
+        _size_histograms.setdefault(kind, _Histogram(SIZE_BUCKETS)).observe(nbytes)
+    if METRICS_LOG:
+        logger.info(json.dumps({"metric": "size_bytes", "kind": kind, "value": nbytes}))
+
+
+def inc(name, value=1, **labels):
+    """زيادة عدّاد (مثل عدد التوكنات أو بايتات الصوت)"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    if METRICS_LOG:
+        logger.info(json.dumps({"metric": name, "labels": labels, "value": value}, ensure_ascii=False))
+
+
+@contextmanager
+def timed(stage):
+    """قياس زمن الكتلة وتسجيله تحت اسم المرحلة"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def record_token_usage(usage_metadata):
+    """تسجيل عدد توكنات الطلب والرد من usage_metadata الخاص بـ Gemini"""
+    if usage_metadata is None:
+        return
+    inc("gemini_tokens_total", getattr(usage_metadata, "prompt_token_count", 0) or 0, kind="prompt")
+    inc("gemini_tokens_total", getattr(usage_metadata, "candidates_token_count", 0) or 0, kind="response")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _cache_lines():
+    # الاستيراد هنا لتجنب الاستيراد الدائري مع الوحدات التي تستخدم metrics
+    from assistant.answer_cache import get_answer_cache
+    from assistant.audio_cache import get_audio_cache
+    from assistant.audio_store import get_clip_store
+
+    lines = [
+        "# HELP assistant_cache_requests_total Cache lookups by result.",
+        "# TYPE assistant_cache_requests_total counter",
+    ]
+    ratios = []
+    caches = {
+        "audio": get_audio_cache().stats(),
+        "answer": get_answer_cache().stats(),
+        "clips": get_clip_store().stats(),
+    }
+    for cache, stats in caches.items():
+        results = {key: value for key, value in stats.items() if key in ("hits", "disk_hits", "near_hits", "misses")}
+        for result, value in results.items():
+            lines.append(f'assistant_cache_requests_total{{cache="{cache}",result="{result}"}} {value}')
+        total = sum(results.values())
+        hit_ratio = (total - results.get("misses", 0)) / total if total else 0.0
+        ratios.append(f'assistant_cache_hit_ratio{{cache="{cache}"}} {hit_ratio:.4f}')
+    lines += ["# HELP assistant_cache_hit_ratio Share of lookups served from cache.",
+              "# TYPE assistant_cache_hit_ratio gauge", *ratios]
+
+    lines += _request_engine_lines()
+    lines += _audio_worker_lines()
+
+    lines += ["# HELP assistant_cache_memory_bytes Bytes held in memory by each cache.",
+              "# TYPE assistant_cache_memory_bytes gauge"]
+    for cache in ("audio", "clips"):
+        lines.append(f'assistant_cache_memory_bytes{{cache="{cache}"}} {caches[cache]["bytes"]}')
+    lines += ["# HELP assistant_cache_evictions_total Entries evicted from memory.",
+              "# TYPE assistant_cache_evictions_total counter"]
+    for cache in ("audio", "clips"):
+        lines.append(f'assistant_cache_evictions_total{{cache="{cache}"}} {caches[cache]["evictions"]}')
+    return lines
+
+
+def _request_engine_lines():
+    from assistant.request_engine import get_request_engine
+
+    lines = [
+        "# HELP assistant_backend_requests Requests waiting for or holding a backend slot.",
+        "# TYPE assistant_backend_requests gauge",
+    ]
+    for backend, stats in get_request_engine().stats().items():
+        lines.append(f'assistant_backend_requests{{backend="{backend}",state="pending"}} {stats["pending"]}')
+        lines.append(f'assistant_backend_requests{{backend="{backend}",state="in_flight"}} {stats["in_flight"]}')
+    return lines
+
+
+def _audio_worker_lines():
+    from assistant.audio_workers import get_audio_workers
+
+    stats = get_audio_workers().stats()
+    return [
+        "# HELP assistant_audio_jobs Audio jobs in the process pool queue.",
+        "# TYPE assistant_audio_jobs gauge",
+        f'assistant_audio_jobs{{state="queued"}} {stats["queued"]}',
+        f'assistant_audio_jobs{{state="running"}} {stats["running"]}',
+    ]
+
+
+def render_prometheus():
+    """كل القياسات بصيغة Prometheus النصية"""
+    lines = [
+        "# HELP assistant_stage_seconds Latency of each pipeline stage.",
+        "# TYPE assistant_stage_seconds histogram",
+    ]
+    with _lock:
+        for stage, histogram in sorted(_histograms.items()):
+            lines += histogram.lines("assistant_stage_seconds", "stage", stage)
+
+        lines += [
+            "# HELP assistant_size_bytes Sizes such as audio memory held per session.",
+            "# TYPE assistant_size_bytes histogram",
+        ]
+        for kind, histogram in sorted(_size_histograms.items()):
+            lines += histogram.lines("assistant_size_bytes", "kind", kind)
+
+        names = sorted({name for name, _ in _counters})
+        for name in names:
+            lines.append(f"# TYPE assistant_{name} counter")
+            for (counter_name, labels), value in sorted(_counters.items()):
+                if counter_name == name:
+                    lines.append(f"assistant_{name}{_format_labels(labels)} {value}")
+
+    lines += _cache_lines()
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        payload = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """تشغيل نقطة /metrics مرة واحدة لكل عملية (لا شيء إذا لم يُحدد المنفذ)"""
+    global _server
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
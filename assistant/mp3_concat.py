@@ -0,0 +1,94 @@
+"""دمج مقاطع MP3 في ملف واحد بدون إعادة ترميز مع جدول بدايات كل مقطع"""
+import os
+
+# تشغيل الرد كملف واحد متصل بدلاً من تبديل المقاطع (ضع 1 للتفعيل)
+SINGLE_AUDIO_STREAM = os.environ.get("SINGLE_AUDIO_STREAM", "0") == "1"
+
+# معدلات البت بالكيلوبت حسب (الإصدار، الطبقة) - الفهرس 0 حر و 15 غير صالح
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+
+def _parse_frame_header(data, pos):
+    """إرجاع (طول الإطار، عدد العينات، معدل العينة) أو None إن لم يكن إطاراً صالحاً"""
+    if pos + 4 > len(data):
+        return None
+    b1, b2 = data[pos + 1], data[pos + 2]
+    if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = {3: 1, 2: 2, 0: 2.5}.get((b1 >> 3) & 0x03)
+    layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or version == 1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return length, samples, sample_rate
+
+
+def strip_tags(data):
+    """إزالة وسوم ID3v2 من البداية و ID3v1 من النهاية"""
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    end = len(data)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    return data[start:end]
+
+
+def mp3_frames(data):
+    """إرجاع بيانات الإطارات فقط ومدتها بالثواني"""
+    data = strip_tags(data)
+    pos = 0
+    duration = 0.0
+    frames = bytearray()
+    while pos + 4 <= len(data):
+        header = _parse_frame_header(data, pos)
+        if header is None:
+            # البحث عن بداية الإطار التالي
+            pos += 1
+            continue
+        length, samples, sample_rate = header
+        frames += data[pos:pos + length]
+        duration += samples / sample_rate
+        pos += length
+    return bytes(frames), duration
+
+
+def concat_mp3(clips):
+    """دمج المقاطع في ملف واحد وإرجاع (البايتات، قائمة بدايات المقاطع بالثواني)"""
+    joined = bytearray()
+    chapters = []
+    offset = 0.0
+    for clip in clips:
+        frames, duration = mp3_frames(clip)
+        if not frames:
+            continue
+        chapters.append(round(offset, 3))
+        joined += frames
+        offset += duration
+    return bytes(joined), chapters
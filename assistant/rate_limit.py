@@ -0,0 +1,138 @@
+"""تحديد معدل الطلبات لكل خدمة (token bucket) وإعادة المحاولة مع تأخير أُسّي عشوائي
+
+الدلو يمتلئ بمعدل ثابت (طلب/ثانية) حتى سعة الدفعة، وكل طلب يستهلك رمزاً واحداً؛
+إن لم يوجد رمز يُرجَع زمن الانتظار بدلاً من الرفض. عند ضبط RATE_LIMIT_DIR
+تُحفظ حالة الدلو في ملف محمي بقفل fcntl فيتقاسم الحد كل العمليات على نفس
+الخادم (مثلاً التطبيق مع دفعة batch أو التسخين).
+"""
+import json
+import os
+import random
+import threading
+import time
+
+# المعدل المسموح (طلب في الثانية) وسعة الدفعة لكل خدمة
+BACKEND_RATES = {
+    "gemini": float(os.environ.get("GEMINI_RATE_PER_SEC", "2")),
+    "stt": float(os.environ.get("STT_RATE_PER_SEC", "5")),
+    "tts": float(os.environ.get("TTS_RATE_PER_SEC", "10")),
+}
+BACKEND_BURSTS = {
+    "gemini": float(os.environ.get("GEMINI_RATE_BURST", "4")),
+    "stt": float(os.environ.get("STT_RATE_BURST", "5")),
+    "tts": float(os.environ.get("TTS_RATE_BURST", "20")),
+}
+
+# مجلد ملفات الدلاء المشتركة بين العمليات (فارغ = حد داخل العملية فقط)
+RATE_LIMIT_DIR = os.environ.get("RATE_LIMIT_DIR", "")
+
+# إعادة المحاولة عند أخطاء الحصة أو الشبكة المؤقتة
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "8"))
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "TooManyRequests",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "ConnectionError",
+    "Timeout",
+    "ReadTimeout",
+    "ConnectTimeout",
+}
+_RETRYABLE_WORDS = ("429", "quota", "rate limit", "too many requests", "503", "unavailable")
+
+
+class TokenBucket:
+    """دلو رموز داخل العملية"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """حجز رمز وإرجاع زمن الانتظار بالثواني قبل استخدامه (0 = فوراً)"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class FileTokenBucket:
+    """دلو رموز حالته في ملف يتقاسمه كل العمليات على نفس الخادم"""
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def reserve(self):
+        """حجز رمز وإرجاع زمن الانتظار بالثواني قبل استخدامه (0 = فوراً)"""
+        import fcntl
+
+        if self.rate <= 0:
+            return 0.0
+        with open(self.path, "a+") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read() or "{}")
+                except ValueError:
+                    state = {}
+                # time.time وليس monotonic لأن الساعة مشتركة بين العمليات
+                now = time.time()
+                tokens = state.get("tokens", self.burst)
+                updated = state.get("updated", now)
+                tokens = min(self.burst, tokens + max(now - updated, 0) * self.rate) - 1
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps({"tokens": tokens, "updated": now}))
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+
+def create_bucket(backend):
+    """دلو الخدمة حسب الإعدادات: مشترك عبر ملف عند ضبط RATE_LIMIT_DIR"""
+    rate = BACKEND_RATES.get(backend, 0)
+    burst = BACKEND_BURSTS.get(backend, 1)
+    if RATE_LIMIT_DIR:
+        return FileTokenBucket(os.path.join(RATE_LIMIT_DIR, f"{backend}.bucket"), rate, burst)
+    return TokenBucket(rate, burst)
+
+
+def is_retryable(error):
+    """هل الخطأ مؤقت (حصة أو ازدحام أو شبكة) فتفيد إعادة المحاولة؟"""
+    # نفحص الأسماء والرموز بدلاً من استيراد أصناف google.api_core/requests/gtts
+    for cls in type(error).__mro__:
+        if cls.__name__ in _RETRYABLE_NAMES:
+            return True
+    for attr in ("code", "status_code"):
+        status = getattr(error, attr, None)
+        if callable(status):
+            continue
+        if isinstance(status, int) and status in _RETRYABLE_STATUS:
+            return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) in _RETRYABLE_STATUS:
+        return True
+    message = str(error).lower()
+    return any(word in message for word in _RETRYABLE_WORDS)
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """تأخير أُسّي بعشوائية كاملة (full jitter) للمحاولة رقم attempt (تبدأ من 1)"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
@@ -0,0 +1,306 @@
+"""محرك طلبات مشترك بين كل الجلسات للخدمات الخارجية (Gemini والتعرف على الكلام وتحويل النص إلى صوت)
+
+يعمل على حلقة asyncio واحدة في خيط خلفي. لكل خدمة حد للطلبات المتزامنة
+(Semaphore) وحد لعدد الطلبات المنتظرة؛ عند تجاوزه يُرفض الطلب فوراً بـ
+BackendBusyError بدلاً من تراكم الطوابير (backpressure). الاستدعاءات نفسها
+متزامنة (SDK أو requests) فتُنفَّذ في مجمع خيوط، وطلبات HTTP لتحويل الصوت
+والتعرف على الكلام تمر عبر جلسة requests مشتركة لكل خدمة تبقي الاتصالات
+مفتوحة (keep-alive) فلا تتكرر مصافحة TLS مع كل نقطة.
+
+تُوزَّع الأماكن الشاغرة حسب الأولوية (الأسئلة التفاعلية قبل الدفعات والتسخين)،
+ويمر كل استدعاء بدلو معدل الخدمة، وتُعاد المحاولة عند أخطاء الحصة المؤقتة مع
+تأخير أُسّي عشوائي، فتتحول الذروات إلى انتظار منظم بدلاً من أخطاء.
+"""
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from assistant import metrics
+from assistant.rate_limit import RETRY_MAX_ATTEMPTS, backoff_delay, create_bucket, is_retryable
+
+# الحد الأقصى للطلبات المتزامنة لكل خدمة
+BACKEND_LIMITS = {
+    "gemini": int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8")),
+    "stt": int(os.environ.get("STT_MAX_CONCURRENCY", "4")),
+    "tts": int(os.environ.get("TTS_MAX_CONCURRENCY", "8")),
+}
+
+# الحد الأقصى للطلبات المنتظرة لكل خدمة قبل رفض الجديد منها
+REQUEST_MAX_PENDING = int(os.environ.get("REQUEST_MAX_PENDING", "64"))
+
+# الأولوية: الأصغر يُخدم أولاً
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+_priority = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+_cancel_token = contextvars.ContextVar("cancel_token", default=None)
+_call_observer = contextvars.ContextVar("call_observer", default=None)
+
+
+class BackendBusyError(RuntimeError):
+    """الخدمة مشغولة: عدد الطلبات المنتظرة تجاوز REQUEST_MAX_PENDING"""
+
+
+class QueryCancelled(Exception):
+    """أُلغي السؤال (مسح المحادثة أو موضوع جديد أو إغلاق الصفحة) فلا داعي لإكمال طلباته"""
+
+
+class CancelToken:
+    """علامة إلغاء يتشاركها كل ما يخص سؤالاً واحداً من طلبات خارجية
+
+    مع parent تُعد ملغاة أيضاً عند إلغاء الأصل (مثلاً نقطة واحدة داخل سؤال).
+    """
+
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self.parent = parent
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+
+@contextmanager
+def cancel_scope(token):
+    """كل الطلبات داخل الكتلة (ومهام الخيوط التي تنسخ السياق) تتوقف عند إلغاء token"""
+    reset = _cancel_token.set(token)
+    try:
+        yield token
+    finally:
+        _cancel_token.reset(reset)
+
+
+@contextmanager
+def observe_calls(observer):
+    """إبلاغ observer عند انتظار كل طلب (queued) وعند بدء تنفيذه فعلياً (started)
+
+    يفيد من يقيس المهلة من بدء الاستدعاء لا من وقت انتظاره في الطابور.
+    تستقبل queued الطلب المنتظر، ويمكن رفع أولويته عبر raise_priority.
+    """
+    reset = _call_observer.set(observer)
+    try:
+        yield observer
+    finally:
+        _call_observer.reset(reset)
+
+
+def current_cancel_token():
+    """علامة الإلغاء للسياق الحالي (أو None)"""
+    return _cancel_token.get()
+
+
+def current_call_observer():
+    """من يراقب طلبات السياق الحالي عبر observe_calls (أو None)"""
+    return _call_observer.get()
+
+
+def current_priority():
+    """أولوية طلبات السياق الحالي"""
+    return _priority.get()
+
+
+def check_cancelled():
+    """رفع QueryCancelled إذا أُلغي السؤال الحالي"""
+    token = _cancel_token.get()
+    if token is not None and token.cancelled:
+        raise QueryCancelled()
+
+
+def with_priority(priority, func, *args, **kwargs):
+    """تشغيل func بحيث تحمل كل طلباتها الخارجية الأولوية المعطاة"""
+    token = _priority.set(priority)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _priority.reset(token)
+
+
+class _QueuedRequest:
+    """طلب في محرك الطلبات يمكن رفع أولويته ما دام ينتظر مكاناً"""
+
+    def __init__(self, engine, backend, priority):
+        self._engine = engine
+        self.backend = backend
+        self.priority = priority
+        self.waiter = None
+
+    def raise_priority(self, priority):
+        """تقديم الطلب إلى أولوية أعلى (أصغر)، مثلاً عندما ينتظر سؤال تفاعلي نتيجته"""
+        if priority < self.priority:
+            slots = self._engine._slots[self.backend]
+            self._engine._loop.call_soon_threadsafe(slots.reprioritize, self, priority)
+
+
+class _PrioritySlots:
+    """مثل asyncio.Semaphore لكن يوقظ المنتظرين حسب الأولوية ثم ترتيب الوصول"""
+
+    def __init__(self, limit):
+        self._free = limit
+        self._waiters = []
+        self._counter = itertools.count()
+
+    async def acquire(self, request):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        request.waiter = future
+        heapq.heappush(self._waiters, (request.priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # أُعطي المكان ثم أُلغي الطلب قبل استخدامه
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def reprioritize(self, request, priority):
+        if priority >= request.priority:
+            return
+        request.priority = priority
+        waiter = request.waiter
+        if waiter is not None and not waiter.done():
+            # يبقى المدخل القديم في الكومة ويُتجاوز عند إخراجه لأن انتظاره اكتمل
+            heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class RequestEngine:
+    """حلقة asyncio خلفية تنظّم الطلبات الخارجية لكل خدمة"""
+
+    def __init__(self, limits=None, max_pending=REQUEST_MAX_PENDING, max_attempts=RETRY_MAX_ATTEMPTS):
+        self.limits = dict(limits or BACKEND_LIMITS)
+        self.max_pending = max_pending
+        self.max_attempts = max(max_attempts, 1)
+        self._pending = {backend: 0 for backend in self.limits}
+        self._in_flight = {backend: 0 for backend in self.limits}
+        self._counts_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(self.limits.values()), thread_name_prefix="request"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="request-engine", daemon=True)
+        self._thread.start()
+        self._slots = {backend: _PrioritySlots(limit) for backend, limit in self.limits.items()}
+        self._buckets = {backend: create_bucket(backend) for backend in self.limits}
+
+    async def _run(self, backend, call, request, token, observer):
+        slots = self._slots[backend]
+        waiting = True
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                await slots.acquire(request)
+                with self._counts_lock:
+                    if waiting:
+                        self._pending[backend] -= 1
+                        waiting = False
+                    self._in_flight[backend] += 1
+                try:
+                    # السؤال أُلغي أثناء الانتظار: لا نستهلك حصة الخدمة عليه
+                    if token is not None and token.cancelled:
+                        metrics.inc("backend_cancelled_total", backend=backend)
+                        raise QueryCancelled()
+                    # الدلو المشترك عبر ملف يقفل الملف ويقرأه، فيُحجز في خيط خارج الحلقة
+                    delay = await self._loop.run_in_executor(self._executor, self._buckets[backend].reserve)
+                    if delay > 0:
+                        metrics.inc("backend_throttled_total", backend=backend)
+                        await asyncio.sleep(delay)
+                    if observer is not None:
+                        observer.started()
+                    return await self._loop.run_in_executor(self._executor, call)
+                except Exception as error:
+                    if attempt >= self.max_attempts or isinstance(error, QueryCancelled) or not is_retryable(error):
+                        raise
+                    metrics.inc("backend_retries_total", backend=backend)
+                finally:
+                    with self._counts_lock:
+                        self._in_flight[backend] -= 1
+                    slots.release()
+                # ننتظر خارج المكان حتى لا نحجزه عن طلبات أخرى
+                await asyncio.sleep(backoff_delay(attempt))
+        except asyncio.CancelledError:
+            if waiting:
+                with self._counts_lock:
+                    self._pending[backend] -= 1
+            raise
+
+    def submit(self, backend, func, *args, **kwargs):
+        """جدولة استدعاء لخدمة معينة وإرجاع concurrent.futures.Future"""
+        check_cancelled()
+        with self._counts_lock:
+            if self._pending[backend] >= self.max_pending:
+                raise BackendBusyError(f"الخدمة {backend} مشغولة حالياً، حاول مرة أخرى بعد قليل")
+            self._pending[backend] += 1
+        call = functools.partial(func, *args, **kwargs)
+        request = _QueuedRequest(self, backend, _priority.get())
+        observer = _call_observer.get()
+        if observer is not None:
+            observer.queued(request)
+        coroutine = self._run(backend, call, request, _cancel_token.get(), observer)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, backend, func, *args, **kwargs):
+        """مثل submit لكن ينتظر النتيجة (للاستخدام من الكود المتزامن)"""
+        return self.submit(backend, func, *args, **kwargs).result()
+
+    def stats(self):
+        """عدد الطلبات المنتظرة والجارية لكل خدمة"""
+        with self._counts_lock:
+            return {
+                backend: {
+                    "pending": self._pending[backend],
+                    "in_flight": self._in_flight[backend],
+                    "limit": limit,
+                }
+                for backend, limit in self.limits.items()
+            }
+
+
+_engine = None
+_http_sessions = {}
+_lock = threading.Lock()
+
+
+def get_request_engine():
+    """محرك الطلبات المشترك على مستوى العملية"""
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = RequestEngine()
+        return _engine
+
+
+def get_http_session(backend):
+    """جلسة requests مشتركة لكل خدمة مع مجمع اتصالات keep-alive بحجم حدها
+
+    الجلسة تحترم إعدادات البيئة (الوكيل HTTPS_PROXY وشهادات REQUESTS_CA_BUNDLE).
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        session = _http_sessions.get(backend)
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=BACKEND_LIMITS.get(backend, 10))
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_sessions[backend] = session
+        return session
+
@@ -0,0 +1,124 @@
+"""دمج الطلبات المتطابقة المتزامنة (single-flight)
+
+عندما يسأل فصل كامل نفس السؤال في نفس اللحظة، ينفّذ أول طلب الاستدعاء الفعلي
+وينتظر الباقون نتيجته بدلاً من إرسال نفس الطلب للخدمة مرات عديدة.
+"""
+import threading
+
+from assistant import metrics
+from assistant.request_engine import check_cancelled, current_call_observer, current_priority, observe_calls
+
+# كل كم ثانية يتحقق المنتظر من إلغاء سؤاله (أو تجاوز مهلة نقطته)
+_CANCEL_CHECK_INTERVAL = 0.2
+
+
+class _Call:
+    """الاستدعاء الجاري لمفتاح واحد
+
+    يمر عليه إبلاغ محرك الطلبات لصاحب الطلب الأول (queued و started) فيصل
+    أيضاً إلى المنتظرين: تتوقف ساعة مهلة المنتظر ما دام الطلب في الطابور.
+    وإذا انضم منتظر بأولوية أعلى رُفعت أولوية الطلب إليها.
+    """
+
+    def __init__(self, observer, priority):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self._observers = [] if observer is None else [observer]
+        self._priority = priority
+        self._request = None
+        self._lock = threading.Lock()
+
+    def queued(self, request):
+        with self._lock:
+            self._request = request
+            request.raise_priority(self._priority)
+            for observer in self._observers:
+                observer.queued(request)
+
+    def started(self):
+        with self._lock:
+            self._request = None
+            for observer in self._observers:
+                observer.started()
+
+    def join(self, observer, priority):
+        with self._lock:
+            self._priority = min(self._priority, priority)
+            if self._request is not None:
+                self._request.raise_priority(priority)
+            if observer is not None:
+                self._observers.append(observer)
+                if self._request is not None:
+                    observer.queued(self._request)
+
+    def leave(self, observer):
+        with self._lock:
+            if observer in self._observers:
+                self._observers.remove(observer)
+
+    def wait(self):
+        # يتوقف المنتظر عند إلغاء سؤاله فلا يبقى خيطه محجوزاً حتى ينتهي غيره
+        while not self.done.wait(_CANCEL_CHECK_INTERVAL):
+            check_cancelled()
+
+
+class SingleFlight:
+    """مجموعة طلبات يُدمج فيها المتطابق حسب المفتاح
+
+    retry_errors: أخطاء خاصة بصاحب الطلب الأول (مثل إلغاء سؤاله) لا تُشارك،
+    بل يعيد المنتظرون المحاولة بأنفسهم، ومثلها مقاطعة خيطه (BaseException).
+    """
+
+    def __init__(self, name, retry_errors=()):
+        self.name = name
+        self.retry_errors = tuple(retry_errors)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """تنفيذ func مرة واحدة لكل مفتاح جارٍ وإرجاع (النتيجة، هل هي مشتركة من طلب آخر)
+
+        يرفع المنتظر QueryCancelled إذا أُلغي سؤاله قبل اكتمال الطلب.
+        """
+        observer = current_call_observer()
+        priority = current_priority()
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call(observer, priority)
+
+            if not leader:
+                call.join(observer, priority)
+                try:
+                    call.wait()
+                finally:
+                    call.leave(observer)
+                if isinstance(call.error, self.retry_errors) or (
+                    call.error is not None and not isinstance(call.error, Exception)
+                ):
+                    continue
+                metrics.inc("single_flight_total", group=self.name, role="shared")
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+
+            metrics.inc("single_flight_total", group=self.name, role="leader")
+            try:
+                with observe_calls(call):
+                    call.result = func(*args, **kwargs)
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+    def in_flight(self):
+        """عدد المفاتيح الجارية حالياً"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,69 @@
+"""تقسيم النقاط الطويلة إلى وحدات كلام متقاربة الطول وإعادة تجميع صوتها بالترتيب
+
+gTTS يقسم النص الطويل داخلياً ويرسل أجزاءه واحداً بعد الآخر، فتصبح النقطة
+الطويلة أبطأ مرحلة في الرد. التقسيم هنا عند نهايات الجمل ثم الفواصل العربية
+يجعل كل وحدة طلباً واحداً يمكن إرساله بالتوازي مع غيره.
+"""
+import math
+import os
+import re
+
+from assistant.audio_workers import get_audio_workers
+from assistant.encoding import get_audio_format
+from assistant.mp3_concat import concat_mp3
+
+# أقصى طول لوحدة الكلام (حد gTTS لكل طلب هو 100 حرف، و 0 = بدون تقسيم)
+TTS_CHUNK_CHARS = int(os.environ.get("TTS_CHUNK_CHARS", "100"))
+
+# حدود التقسيم: نهاية جملة أو فاصلة دائماً، والمسافة فقط لجزء ما زال أطول من الحد
+_CLAUSE_BOUNDARY = re.compile(r"(?<=[.!?؟۔…،؛,;:])\s+|\n+")
+_WORD_BOUNDARY = re.compile(r"\s+")
+
+
+def _split_pieces(text, max_chars):
+    pieces = []
+    for clause in _CLAUSE_BOUNDARY.split(text):
+        clause = clause.strip()
+        if len(clause) > max_chars:
+            pieces.extend(word for word in _WORD_BOUNDARY.split(clause) if word)
+        elif clause:
+            pieces.append(clause)
+    return pieces
+
+
+def _partition(pieces, count):
+    # كل جزء يذهب للوحدة التي يقع فيها منتصفه من الطول الكلي مقسوماً بالتساوي
+    total = sum(len(piece) for piece in pieces) + len(pieces) - 1
+    size = total / count
+    groups = [[] for _ in range(count)]
+    position = 0
+    for piece in pieces:
+        groups[min(count - 1, int((position + len(piece) / 2) / size))].append(piece)
+        position += len(piece) + 1
+    return [" ".join(group) for group in groups if group]
+
+
+def split_speech_units(text, max_chars=None):
+    """تقسيم النص إلى أقل عدد من الوحدات متقاربة الطول لا تتجاوز max_chars
+
+    التقسيم عند نهايات الجمل والفواصل (وعند المسافات لجملة أطول من الحد)،
+    ولا يُقسم النص إذا كانت الصيغة غير MP3 لأن دمج المقاطع بدون إعادة ترميز
+    متاح لإطارات MP3 فقط.
+    """
+    max_chars = TTS_CHUNK_CHARS if max_chars is None else max_chars
+    text = text.strip()
+    if max_chars <= 0 or len(text) <= max_chars or get_audio_format().ext != "mp3":
+        return [text]
+
+    pieces = _split_pieces(text, max_chars)
+    for count in range(math.ceil(len(text) / max_chars), len(pieces)):
+        units = _partition(pieces, count)
+        if all(len(unit) <= max_chars for unit in units):
+            return units
+    return pieces
+
+
+def join_speech_units(clips):
+    """دمج صوت وحدات النقطة بالترتيب في مقطع MP3 واحد"""
+    joined, _ = get_audio_workers().run(concat_mp3, list(clips))
+    return joined or b"".join(clips)
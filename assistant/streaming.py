@@ -0,0 +1,44 @@
+"""استخراج النقاط من رد Gemini، كاملاً أو أثناء وصوله على دفعات"""
+import os
+import re
+
+# تفعيل وضع البث (ضع 0 للرجوع إلى الطلب الكامل المتزامن)
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "1") != "0"
+
+_BULLET_MARKER_RE = re.compile(r'^[•\-\*]\s*')
+
+
+def clean_bullet_line(line):
+    """إزالة علامة النقطة وإرجاع السطر إن كان طويلاً بما يكفي وإلا None"""
+    line = _BULLET_MARKER_RE.sub('', line.strip())
+    if line and len(line) > 10:
+        return line
+    return None
+
+
+def extract_bullet_points(text):
+    """استخراج النقاط من النص"""
+    bullets = []
+
+    for line in text.split('\n'):
+        bullet = clean_bullet_line(line)
+        if bullet:
+            bullets.append(bullet)
+
+    return bullets if bullets else [text]
+
+
+def iter_stream_bullets(chunks):
+    """إرجاع كل نقطة مكتملة بمجرد انتهاء سطرها في الرد المتدفق"""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            bullet = clean_bullet_line(line)
+            if bullet:
+                yield bullet
+
+    bullet = clean_bullet_line(buffer)
+    if bullet:
+        yield bullet
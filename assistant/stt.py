@@ -0,0 +1,198 @@
+"""تجهيز صوت المسجل والتعرف على الكلام عبر محرك قابل للاختيار"""
+import json
+import os
+import threading
+
+import speech_recognition as sr
+
+from assistant.audio_workers import get_audio_workers
+from assistant.request_engine import get_http_session, get_request_engine
+
+# محرك التعرف على الكلام: google أو vosk (بدون إنترنت) أو fake (للاختبارات)
+STT_BACKEND = os.environ.get("STT_BACKEND", "google")
+
+# مجلد نموذج Vosk العربي عند استخدام المحرك المحلي
+VOSK_MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "models/vosk-model-ar")
+
+# النص الثابت الذي يرجعه المحرك الوهمي
+FAKE_STT_TEXT = os.environ.get("FAKE_STT_TEXT", "من هو رمسيس الثاني")
+
+
+def downmix_pcm(raw_data, frame_rate, sample_width, channels):
+    """دمج قنوات PCM في قناة واحدة (تُنفَّذ في عملية معالجة الصوت)"""
+    from pydub import AudioSegment
+
+    segment = AudioSegment(data=raw_data, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+    return segment.set_channels(1).raw_data
+
+
+def audio_data_from_segment(audio_segment, owner=None):
+    """تحويل AudioSegment من المسجل إلى sr.AudioData مباشرة من بيانات PCM في الذاكرة
+
+    يتجنب هذا التصدير إلى WAV عبر ffmpeg وإعادة قراءته ونسخه أكثر من مرة.
+    """
+    raw_data = audio_segment.raw_data
+    # sr.AudioData يتوقع صوتاً أحادي القناة
+    if audio_segment.channels > 1:
+        raw_data = get_audio_workers().run(
+            downmix_pcm,
+            raw_data,
+            audio_segment.frame_rate,
+            audio_segment.sample_width,
+            audio_segment.channels,
+            owner=owner,
+        )
+    return sr.AudioData(raw_data, audio_segment.frame_rate, audio_segment.sample_width)
+
+
+class STTBackend:
+    """واجهة محرك التعرف على الكلام
+
+    ترجع recognize النص، وترفع sr.UnknownValueError إذا لم يُفهم الكلام
+    و sr.RequestError إذا تعذر الوصول إلى المحرك.
+    """
+
+    name = "base"
+
+    def recognize(self, audio_data):
+        raise NotImplementedError
+
+
+class GoogleSTT(STTBackend):
+    """خدمة Google للتعرف على الكلام (تحتاج اتصالاً بالإنترنت)
+
+    يُبنى الطلب ويُقرأ الرد بأدوات SpeechRecognition نفسها، لكنه يُرسل عبر
+    get_http_session("stt") بدلاً من urllib الذي يفتح اتصالاً جديداً كل مرة.
+    """
+
+    name = "google"
+
+    def __init__(self, language="ar-SA"):
+        self.language = language
+
+    def recognize(self, audio_data):
+        import requests
+
+        try:
+            from speech_recognition.recognizers.google import ENDPOINT, OutputParser, create_request_builder
+        except ImportError:
+            # نسخ SpeechRecognition الأقدم لا تفصل بناء الطلب عن إرساله
+            return sr.Recognizer().recognize_google(audio_data, language=self.language)
+
+        request = create_request_builder(endpoint=ENDPOINT, language=self.language).build(audio_data)
+        try:
+            response = get_http_session("stt").post(
+                request.full_url, data=request.data, headers=dict(request.header_items())
+            )
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            raise sr.RequestError(f"recognition request failed: {response.reason}")
+        except requests.exceptions.RequestException as e:
+            raise sr.RequestError(f"recognition connection failed: {e}")
+        return OutputParser(show_all=False, with_confidence=False).parse(response.content.decode("utf-8"))
+
+
+class VoskSTT(STTBackend):
+    """محرك Vosk المحلي على المعالج بدون أي اتصال خارجي"""
+
+    name = "vosk"
+    sample_rate = 16000
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load_model(self):
+        # تحميل النموذج مرة واحدة فقط لأنه يستغرق عدة ثوانٍ
+        with self._lock:
+            if self._model is None:
+                try:
+                    from vosk import Model
+                except ImportError:
+                    raise sr.RequestError("مكتبة vosk غير مثبتة (pip install vosk)")
+                if not os.path.isdir(self.model_path):
+                    raise sr.RequestError(f"لم يتم العثور على نموذج Vosk في {self.model_path}")
+                self._model = Model(self.model_path)
+            return self._model
+
+    def recognize(self, audio_data):
+        from vosk import KaldiRecognizer
+
+        recognizer = KaldiRecognizer(self._load_model(), self.sample_rate)
+        recognizer.AcceptWaveform(
+            audio_data.get_raw_data(convert_rate=self.sample_rate, convert_width=2)
+        )
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class FakeSTT(STTBackend):
+    """محرك وهمي يرجع نصاً ثابتاً (للاختبارات وقياس الأداء)"""
+
+    name = "fake"
+
+    def __init__(self, text=FAKE_STT_TEXT):
+        self.text = text
+
+    def recognize(self, audio_data):
+        if not self.text:
+            raise sr.UnknownValueError()
+        return self.text
+
+
+STT_BACKENDS = {
+    "google": GoogleSTT,
+    "vosk": VoskSTT,
+    "fake": FakeSTT,
+}
+
+_stt_backend = None
+_stt_backend_lock = threading.Lock()
+
+
+def create_stt_backend(name):
+    """إنشاء محرك بالاسم"""
+    try:
+        return STT_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"محرك التعرف على الكلام غير معروف: {name}")
+
+
+def _recognize_segment(audio_segment, owner):
+    return get_stt_backend().recognize(audio_data_from_segment(audio_segment, owner))
+
+
+def start_recognition(audio_segment, owner=None):
+    """بدء تجهيز التسجيل والتعرف على الكلام في الخلفية عبر محرك الطلبات المشترك وإرجاع Future بالنص"""
+    return get_request_engine().submit("stt", _recognize_segment, audio_segment, owner)
+
+
+def finish_recognition(future):
+    """انتظار نتيجة start_recognition وإرجاع (النص، رسالة الخطأ)"""
+    try:
+        return future.result(), None
+    except sr.UnknownValueError:
+        return None, "لم أستطع فهم الصوت. يرجى المحاولة مرة أخرى."
+    except sr.RequestError as e:
+        return None, f"خطأ في خدمة التعرف على الكلام: {e}"
+    except Exception as e:
+        return None, f"خطأ غير متوقع في معالجة الصوت: {e}"
+
+
+def get_stt_backend():
+    """المحرك المختار في الإعدادات (STT_BACKEND) ومشترك بين كل الجلسات"""
+    global _stt_backend
+    with _stt_backend_lock:
+        if _stt_backend is None:
+            _stt_backend = create_stt_backend(STT_BACKEND)
+        return _stt_backend
+
+
+def set_stt_backend(backend):
+    """استبدال المحرك المشترك لكل العملية (لقياس الأداء والاختبارات)"""
+    global _stt_backend
+    with _stt_backend_lock:
+        _stt_backend = backend
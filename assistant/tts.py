@@ -0,0 +1,184 @@
+"""تحويل النص إلى صوت عبر محرك قابل للاختيار (كل المحركات ترجع MP3)"""
+import base64
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from assistant import metrics
+from assistant.audio_cache import cache_key, get_audio_cache, normalize_text
+from assistant.encoding import get_audio_format, transcode_speech
+from assistant.request_engine import QueryCancelled, get_http_session, get_request_engine
+from assistant.single_flight import SingleFlight
+
+# محرك تحويل النص إلى صوت: gtts أو espeak (بدون إنترنت) أو fake (لقياس الأداء)
+TTS_ENGINE = os.environ.get("TTS_ENGINE", "gtts")
+
+# الصوت المستخدم مع espeak-ng
+ESPEAK_VOICE = os.environ.get("ESPEAK_VOICE", "ar")
+
+# إطار MP3 صامت: MPEG-2 Layer III، أحادي، 24kHz، 32kbps (96 بايت = 24 مللي ثانية)
+_SILENT_FRAME = b"\xff\xf3\x44\xc4" + b"\x00" * 92
+_SILENT_FRAME_SECONDS = 576 / 24000
+
+
+class TTSEngine:
+    """واجهة محرك تحويل النص إلى صوت، ترجع synthesize بايتات MP3"""
+
+    name = "base"
+
+    def synthesize(self, text, lang="ar", slow=False):
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """خدمة Google TTS عبر جلسة HTTP مشتركة تبقي الاتصال مفتوحاً
+
+    gTTS نفسه يفتح جلسة واتصال TLS جديدين لكل جزء من كل نقطة، لذا تُبنى أجسام
+    الطلبات بواجهته العامة get_bodies وتُرسل عبر get_http_session("tts")،
+    وتُرفع نفس أخطاء gTTSError.
+    """
+
+    name = "gtts"
+
+    def synthesize(self, text, lang="ar", slow=False):
+        # الاستيراد هنا حتى لا تحتاج المحركات الأخرى إلى gTTS
+        import requests
+        from gtts import gTTS, gTTSError
+
+        tts = gTTS(text=text, lang=lang, slow=slow)
+        url = f"https://translate.google.{tts.tld}/_/TranslateWebserverUi/data/batchexecute"
+        # الصوت في الرد نص base64 بعد معرّف الاستدعاء
+        audio_pattern = re.compile(re.escape(tts.GOOGLE_TTS_RPC) + r'","\[\\"(.*)\\"]')
+        session = get_http_session("tts")
+
+        audio = bytearray()
+        for body in tts.get_bodies():
+            try:
+                response = session.post(url, data=body, headers=tts.GOOGLE_TTS_HEADERS, timeout=tts.timeout)
+                response.raise_for_status()
+            except requests.exceptions.HTTPError:
+                raise gTTSError(tts=tts, response=response)
+            except requests.exceptions.RequestException:
+                raise gTTSError(tts=tts)
+            match = audio_pattern.search(response.text)
+            if match is None:
+                raise gTTSError(tts=tts, response=response)
+            audio += base64.b64decode(match.group(1))
+        return bytes(audio)
+
+
+class EspeakEngine(TTSEngine):
+    """espeak-ng محلياً على المعالج، مع تحويل WAV إلى MP3 عبر ffmpeg"""
+
+    name = "espeak"
+
+    def __init__(self, voice=ESPEAK_VOICE):
+        self.voice = voice
+
+    def synthesize(self, text, lang="ar", slow=False):
+        espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+        if espeak is None:
+            raise RuntimeError("espeak-ng غير مثبت على الخادم")
+
+        speed = "120" if slow else "160"
+        wav = subprocess.run(
+            [espeak, "-v", self.voice, "-s", speed, "--stdout", text],
+            check=True, capture_output=True,
+        ).stdout
+        return subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+             "-ac", "1", "-codec:a", "libmp3lame", "-b:a", "48k", "-f", "mp3", "pipe:1"],
+            input=wav, check=True, capture_output=True,
+        ).stdout
+
+
+class FakeEngine(TTSEngine):
+    """محرك وهمي يرجع إطارات MP3 صامتة بطول يتناسب مع النص"""
+
+    name = "fake"
+
+    def __init__(self, seconds_per_char=0.06):
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text, lang="ar", slow=False):
+        seconds = max(1, len(text)) * self.seconds_per_char * (1.5 if slow else 1)
+        return _SILENT_FRAME * max(1, int(seconds / _SILENT_FRAME_SECONDS))
+
+
+TTS_ENGINES = {
+    "gtts": GTTSEngine,
+    "espeak": EspeakEngine,
+    "fake": FakeEngine,
+}
+
+_tts_engine = None
+_tts_engine_lock = threading.Lock()
+
+
+def create_tts_engine(name):
+    """إنشاء محرك بالاسم"""
+    try:
+        return TTS_ENGINES[name]()
+    except KeyError:
+        raise ValueError(f"محرك تحويل النص إلى صوت غير معروف: {name}")
+
+
+def get_tts_engine():
+    """المحرك المختار في الإعدادات (TTS_ENGINE) ومشترك بين كل الجلسات"""
+    global _tts_engine
+    with _tts_engine_lock:
+        if _tts_engine is None:
+            _tts_engine = create_tts_engine(TTS_ENGINE)
+        return _tts_engine
+
+
+def set_tts_engine(engine):
+    """استبدال المحرك المشترك لكل العملية (لقياس الأداء والاختبارات)"""
+    global _tts_engine
+    with _tts_engine_lock:
+        _tts_engine = engine
+
+
+def synthesize_speech(text, lang="ar", slow=False):
+    """تحويل النص إلى بايتات MP3 (لا تستخدم Streamlit، آمنة للخيوط المتعددة)"""
+    return get_tts_engine().synthesize(text, lang=lang, slow=slow)
+
+
+# نفس النقطة المطلوبة من عدة جلسات في نفس اللحظة تُحوَّل إلى صوت مرة واحدة
+_speech_flight = SingleFlight("tts", retry_errors=(QueryCancelled,))
+
+
+def _synthesize_into_cache(engine, cache, key, text, lang, slow, audio_format):
+    # ربما أكمل طلب سابق نفس المقطع بين فحص الذاكرة وبدء هذا الطلب
+    audio = cache.get(key)
+    if audio is None:
+        with metrics.timed("tts_synthesis"):
+            audio = get_request_engine().run(
+                "tts", engine.synthesize, normalize_text(text), lang=lang, slow=slow
+            )
+        metrics.inc("tts_audio_bytes_total", len(audio), engine=engine.name)
+        if audio_format.codec_args is not None:
+            with metrics.timed("tts_encode"):
+                audio = transcode_speech(audio, audio_format)
+            metrics.inc("tts_encoded_bytes_total", len(audio), format=audio_format.name)
+        cache.put(key, audio)
+    return audio
+
+
+def cached_synthesize_speech(text, lang="ar", slow=False):
+    """مثل synthesize_speech لكن مع المرور على ذاكرة الصوت المشتركة أولاً
+
+    يرجع الصوت بالصيغة المختارة في AUDIO_FORMAT (بعد إعادة الترميز إن لزم).
+    """
+    engine = get_tts_engine()
+    cache = get_audio_cache()
+    audio_format = get_audio_format()
+    key = cache_key(text, lang, slow, engine=engine.name, audio_format=audio_format.name)
+    audio = cache.get(key)
+    if audio is None:
+        audio, _ = _speech_flight.do(
+            key, _synthesize_into_cache, engine, cache, key, text, lang, slow, audio_format
+        )
+    return audio
@@ -0,0 +1,249 @@
+"""مرحلة تحويل النقاط إلى صوت بالتوازي مع الحفاظ على ترتيبها"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import NamedTuple, Optional
+
+from assistant.request_engine import CancelToken, cancel_scope, current_cancel_token, observe_calls
+
+# الحد الأقصى لعدد عمليات التحويل المتزامنة لكل طلب (قابل للضبط من متغيرات البيئة)
+TTS_MAX_WORKERS = int(os.environ.get("TTS_MAX_WORKERS", "4"))
+
+# عدد خيوط المجمع المشترك بين كل الجلسات؛ أكبر من حد الخدمة في محرك الطلبات
+# (TTS_MAX_CONCURRENCY) لأن الخيوط تنتظر هناك دورها ولا يجب أن تكون هي الحد
+TTS_POOL_WORKERS = int(os.environ.get("TTS_POOL_WORKERS", "32"))
+
+# المهلة القصوى لكل نقطة بالثواني، تُحسب من لحظة بدء تنفيذها لا من وقت انتظارها
+# في المجمع أو في طابور محرك الطلبات
+TTS_ITEM_TIMEOUT = float(os.environ.get("TTS_ITEM_TIMEOUT", "20"))
+
+# أقصى مدة انتظار قبل إعادة فحص النقاط التي لم تبدأ بعد
+_POLL_INTERVAL = 0.2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class SynthesisResult(NamedTuple):
+    text: str
+    audio: Optional[bytes]
+    error: Optional[BaseException]
+
+
+def get_executor():
+    """مجمع خيوط واحد مشترك بين كل الجلسات في العملية"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=TTS_POOL_WORKERS,
+                thread_name_prefix="tts",
+            )
+        return _executor
+
+
+class _Item:
+    """نقطة مُرسلة للمجمع: وقت بدء تنفيذها وعلامة إلغائها الخاصة
+
+    الساعة تبدأ عند بدء الخيط، وتتوقف أثناء انتظار مكان في محرك الطلبات
+    (أو انتظار نفس المقطع من طلب آخر ما زال في الطابور)، ثم تبدأ من جديد
+    عند إرسال الطلب فعلياً للخدمة.
+    """
+
+    def __init__(self, text, synthesize, timeout):
+        self.text = text
+        self.timeout = timeout
+        self.started_at = None
+        # إلغاء النقطة وحدها (عند تجاوز المهلة) أو مع سؤالها كاملاً
+        self.token = CancelToken(parent=current_cancel_token())
+        # نمرر السياق حتى تصل أولوية الطلب إلى محرك الطلبات
+        context = contextvars.copy_context()
+        self.future = get_executor().submit(context.run, self._run, synthesize)
+
+    def _run(self, synthesize):
+        self.started_at = time.monotonic()
+        with cancel_scope(self.token), observe_calls(self):
+            return synthesize(self.text)
+
+    def queued(self, request):
+        self.started_at = None
+
+    def started(self):
+        self.started_at = time.monotonic()
+
+    def deadline(self):
+        return None if self.started_at is None else self.started_at + self.timeout
+
+    def expire(self):
+        """التخلي عن النقطة: تُلغى إن لم تبدأ، وتُحرر خيطها عند طلبها التالي للخدمة"""
+        self.future.cancel()
+        self.token.cancel()
+        return TimeoutError(f"تجاوز المهلة ({self.timeout:g} ثانية)")
+
+
+def _wait_timeout(items):
+    """مدة الانتظار حتى أقرب مهلة، أو فترة الفحص إذا وُجدت نقاط لم تبدأ"""
+    now = time.monotonic()
+    timeouts = [item.deadline() - now for item in items if item.deadline() is not None]
+    if any(item.started_at is None for item in items):
+        timeouts.append(_POLL_INTERVAL)
+    return max(0.0, min(timeouts)) if timeouts else None
+
+
+def synthesize_all(texts, synthesize, max_workers=None, timeout=None, split=None, join=None):
+    """تحويل قائمة نصوص إلى صوت بالتوازي وإرجاع النتائج بنفس الترتيب
+
+    لا يتجاوز عدد العمليات الجارية لهذا الطلب max_workers، وأي نقطة تتخطى
+    المهلة timeout منذ بدء تنفيذها تُسجّل كخطأ TimeoutError بدلاً من تعطيل
+    باقي النقاط. مع split و join تُقسم كل نقطة إلى وحدات تُرسل الأطول أولاً
+    ثم يُجمع صوت كل نقطة بترتيب وحداتها.
+    """
+    texts = list(texts)
+    if split is not None:
+        return _synthesize_units(texts, synthesize, max_workers, timeout, split, join)
+    max_workers = max(1, max_workers or TTS_MAX_WORKERS)
+    timeout = TTS_ITEM_TIMEOUT if timeout is None else timeout
+
+    results = [None] * len(texts)
+    next_index = 0
+    running = {}
+
+    def submit_next():
+        nonlocal next_index
+        item = _Item(texts[next_index], synthesize, timeout)
+        running[item.future] = (next_index, item)
+        next_index += 1
+
+    while next_index < len(texts) and len(running) < max_workers:
+        submit_next()
+
+    while running:
+        done, _ = wait(
+            running,
+            timeout=_wait_timeout([item for _, item in running.values()]),
+            return_when=FIRST_COMPLETED,
+        )
+
+        for future in done:
+            index, _ = running.pop(future)
+            try:
+                results[index] = SynthesisResult(texts[index], future.result(), None)
+            except Exception as e:
+                results[index] = SynthesisResult(texts[index], None, e)
+
+        now = time.monotonic()
+        for future, (index, item) in list(running.items()):
+            deadline = item.deadline()
+            if deadline is not None and deadline <= now:
+                running.pop(future)
+                results[index] = SynthesisResult(texts[index], None, item.expire())
+
+        while next_index < len(texts) and len(running) < max_workers:
+            submit_next()
+
+    return results
+
+
+def _synthesize_units(texts, synthesize, max_workers, timeout, split, join):
+    units = [(index, part, unit) for index, text in enumerate(texts) for part, unit in enumerate(split(text))]
+    # الأطول أولاً: الوحدات البطيئة تبدأ مبكراً فلا تبقى وحدها في آخر الطابور
+    order = sorted(range(len(units)), key=lambda k: len(units[k][2]), reverse=True)
+    unit_results = synthesize_all([units[k][2] for k in order], synthesize, max_workers, timeout)
+
+    parts = [[] for _ in texts]
+    for k, result in sorted(zip(order, unit_results)):
+        parts[units[k][0]].append(result)
+
+    results = []
+    for text, text_parts in zip(texts, parts):
+        error = next((part.error for part in text_parts if part.error is not None), None)
+        if error is not None:
+            results.append(SynthesisResult(text, None, error))
+            continue
+        try:
+            audio = _join_parts([part.audio for part in text_parts], join)
+            results.append(SynthesisResult(text, audio, None))
+        except Exception as e:
+            results.append(SynthesisResult(text, None, e))
+    return results
+
+
+def _join_parts(clips, join):
+    if len(clips) == 1:
+        return clips[0]
+    return join(clips)
+
+
+class PendingSynthesis(NamedTuple):
+    text: str
+    future: Future
+    items: list
+
+
+def start_synthesis(text, synthesize, timeout=None, split=None, join=None):
+    """بدء تحويل نص واحد إلى صوت فوراً (مثلاً عند وصول نقطة أثناء البث)
+
+    مع split و join تُرسل وحدات النص معاً (الأطول أولاً) ويكتمل future عند
+    تجميع صوتها بالترتيب.
+    """
+    timeout = TTS_ITEM_TIMEOUT if timeout is None else timeout
+    units = split(text) if split is not None else [text]
+    if len(units) == 1:
+        item = _Item(units[0], synthesize, timeout)
+        return PendingSynthesis(text, item.future, [item])
+
+    items = [None] * len(units)
+    for part in sorted(range(len(units)), key=lambda k: len(units[k]), reverse=True):
+        items[part] = _Item(units[part], synthesize, timeout)
+
+    future = Future()
+    remaining = [len(units)]
+    lock = threading.Lock()
+
+    def on_unit_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(_join_parts([item.future.result() for item in items], join))
+        except Exception as e:
+            future.set_exception(e)
+
+    def on_cancel(done):
+        if done.cancelled():
+            for item in items:
+                item.expire()
+
+    future.add_done_callback(on_cancel)
+    for item in items:
+        item.future.add_done_callback(on_unit_done)
+    return PendingSynthesis(text, future, items)
+
+
+def collect_synthesis(pending_list):
+    """انتظار عمليات start_synthesis وإرجاع النتائج بنفس ترتيبها"""
+    results = []
+    for pending in pending_list:
+        while not pending.future.done():
+            now = time.monotonic()
+            expired = [item for item in pending.items if item.deadline() is not None and item.deadline() <= now]
+            if expired:
+                break
+            wait([pending.future], timeout=_wait_timeout(pending.items))
+
+        if not pending.future.done():
+            for item in pending.items:
+                item.expire()
+            pending.future.cancel()
+            results.append(SynthesisResult(pending.text, None, TimeoutError("تجاوز مهلة تحويل الصوت")))
+            continue
+        try:
+            results.append(SynthesisResult(pending.text, pending.future.result(), None))
+        except Exception as e:
+            results.append(SynthesisResult(pending.text, None, e))
+    return results
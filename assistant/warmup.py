@@ -0,0 +1,140 @@
+"""تسخين ذاكرة الإجابات والصوت مسبقاً بأسئلة عن أشهر الشخصيات التاريخية
+
+يعمل داخل التطبيق في خيط خلفي عند ضبط WARMUP_ON_START=1 (ويتكرر كل
+WARMUP_INTERVAL ثانية إن كانت أكبر من صفر)، أو يدوياً من عملية منفصلة:
+    ANSWER_CACHE_DIR=answer_cache python -m assistant.warmup --concurrency 2
+
+التسخين اليدوي لا يفيد التطبيق إلا عبر القرص: نفس ANSWER_CACHE_DIR للإجابات
+ونفس AUDIO_STATIC_DIR للمقاطع في العمليتين.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from assistant import metrics
+from assistant.answer_cache import ANSWER_CACHE_DIR
+from assistant.engine import answer_question
+from assistant.request_engine import PRIORITY_BACKGROUND, with_priority
+
+# تشغيل التسخين تلقائياً عند بدء التطبيق
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "0") == "1"
+
+# إعادة التسخين كل عدد من الثواني (0 مرة واحدة فقط)
+WARMUP_INTERVAL = float(os.environ.get("WARMUP_INTERVAL", "0"))
+
+# عدد الأسئلة التي تُعالج بالتوازي أثناء التسخين
+WARMUP_CONCURRENCY = int(os.environ.get("WARMUP_CONCURRENCY", "2"))
+
+# ملف اختياري بالأسئلة (سؤال في كل سطر) بدلاً من القائمة الافتراضية
+WARMUP_TOPICS_FILE = os.environ.get("WARMUP_TOPICS_FILE")
+
+DEFAULT_TOPICS = [
+    "من هو رمسيس الثاني؟",
+    "من هو توت عنخ آمون؟",
+    "من هي كليوباترا؟",
+    "من هي نفرتيتي؟",
+    "من هي حتشبسوت؟",
+    "من هو أخناتون؟",
+    "من هو الملك خوفو؟",
+    "من هو الملك مينا موحد القطرين؟",
+    "من هو صلاح الدين الأيوبي؟",
+    "من هو محمد علي باشا؟",
+]
+
+_status = {"running": False, "done": 0, "total": 0, "failed": 0, "last_run": None}
+_status_lock = threading.Lock()
+_background_thread = None
+
+
+def load_topics(path=WARMUP_TOPICS_FILE):
+    """الأسئلة من الملف المحدد أو القائمة الافتراضية"""
+    if not path:
+        return list(DEFAULT_TOPICS)
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def warmup_status():
+    """نسخة من حالة آخر تسخين (للعرض أو القياس)"""
+    with _status_lock:
+        return dict(_status)
+
+
+def warm_caches(model, topics, concurrency=WARMUP_CONCURRENCY, progress=None):
+    """تمرير كل سؤال عبر خط المعالجة لملء ذاكرة الإجابات والصوت
+
+    progress(done, total, topic, ok) تُستدعى بعد كل سؤال.
+    """
+    with _status_lock:
+        _status.update(running=True, done=0, total=len(topics), failed=0)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="warmup") as executor:
+        futures = {
+            executor.submit(with_priority, PRIORITY_BACKGROUND, answer_question, model, topic): topic
+            for topic in topics
+        }
+        for future in as_completed(futures):
+            topic = futures[future]
+            try:
+                ok = future.result().is_complete
+            except Exception:
+                ok = False
+            metrics.inc("warmup_topics_total", result="ok" if ok else "failed")
+            with _status_lock:
+                _status["done"] += 1
+                _status["failed"] += 0 if ok else 1
+                done, total = _status["done"], _status["total"]
+            if progress is not None:
+                progress(done, total, topic, ok)
+
+    with _status_lock:
+        _status.update(running=False, last_run=time.time())
+    return warmup_status()
+
+
+def start_background_warmup(model, topics=None, interval=WARMUP_INTERVAL):
+    """تشغيل التسخين مرة واحدة لكل عملية في خيط خلفي (ويتكرر كل interval ثانية)"""
+    global _background_thread
+    with _status_lock:
+        if _background_thread is not None:
+            return _background_thread
+
+        def run():
+            while True:
+                warm_caches(model, topics or load_topics())
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+
+        _background_thread = threading.Thread(target=run, name="warmup", daemon=True)
+        _background_thread.start()
+        return _background_thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="تسخين ذاكرة الإجابات والصوت مسبقاً")
+    parser.add_argument("--topics-file", default=WARMUP_TOPICS_FILE, help="ملف الأسئلة (سؤال في كل سطر)")
+    parser.add_argument("--concurrency", type=int, default=WARMUP_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    if not ANSWER_CACHE_DIR:
+        # بدون مجلد مشترك تُملأ ذاكرة هذه العملية فقط ثم تضيع عند خروجها
+        print("ANSWER_CACHE_DIR غير مضبوط: اضبطه على نفس مجلد التطبيق حتى تصل إليه الإجابات", file=sys.stderr)
+        return 2
+
+    from assistant.gemini import create_model, load_api_key
+
+    def report(done, total, topic, ok):
+        print(f"[{done}/{total}] {'✅' if ok else '❌'} {topic}", file=sys.stderr)
+
+    status = warm_caches(
+        create_model(load_api_key()), load_topics(args.topics_file), args.concurrency, report
+    )
+    return 1 if status["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
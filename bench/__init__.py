@@ -0,0 +1 @@
+"""قياس أداء خط معالجة الأسئلة خارج Streamlit"""
@@ -0,0 +1,122 @@
+"""بدائل محلية لـ Gemini والتعرف على الكلام وتحويل النص إلى صوت بزمن استجابة قابل للضبط
+
+تُركّب في محركات المشروع نفسها (FakeSTT و FakeEngine ونموذج بواجهة Gemini)
+فيمر القياس بخط المعالجة الحقيقي بطوابيره وحدوده وذاكراته.
+"""
+import random
+import threading
+import time
+
+from assistant.stt import FakeSTT
+from assistant.tts import FakeEngine
+
+_FAKE_FACTS = [
+    "حكم الملك رمسيس الثاني مصر قرابة سبعة وستين عاماً في عصر الدولة الحديثة",
+    "شيّد معبد أبو سمبل الشهير في جنوب مصر تخليداً لانتصاراته",
+    "وقّع أول معاهدة سلام مكتوبة في التاريخ مع الحيثيين بعد معركة قادش",
+    "كان له عدد كبير من الأبناء وأشهر زوجاته الملكة نفرتاري",
+    "نُقلت مومياؤه إلى المتحف القومي للحضارة المصرية عام ألفين وواحد وعشرين",
+]
+
+
+class FakeBackend:
+    """إعدادات زمن الاستجابة والتذبذب لخدمة وهمية واحدة (بالثواني)"""
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+
+    def delay(self, share=1.0):
+        time.sleep(max(0.0, (self.latency + random.uniform(-self.jitter, self.jitter)) * share))
+
+
+class SlowSTT(FakeSTT):
+    """FakeSTT مع زمن استجابة خدمة التعرف"""
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    def recognize(self, audio_data):
+        self.backend.delay()
+        return super().recognize(audio_data)
+
+
+class SlowTTS(FakeEngine):
+    """FakeEngine مع زمن استجابة خدمة تحويل النص إلى صوت"""
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    def synthesize(self, text, lang="ar", slow=False):
+        self.backend.delay()
+        return super().synthesize(text, lang=lang, slow=slow)
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    usage_metadata = None
+
+    def __init__(self, text, chunks=None):
+        self.text = text
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+class FakeChat:
+    """جلسة بنفس واجهة ChatSession المستخدمة في المشروع (send_message و history)"""
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, prompt_text, stream=False):
+        text = self.model.answer_text()
+        if not stream:
+            self.model.backend.delay()
+            self._remember(prompt_text, text)
+            return _Response(text)
+
+        lines = text.split("\n")
+
+        def chunks():
+            # زمن الرد يتوزع على أسطره كما يصل البث الحقيقي
+            for line in lines:
+                self.model.backend.delay(1 / len(lines))
+                yield _Chunk(line + "\n")
+            self._remember(prompt_text, text)
+
+        return _Response(text, chunks())
+
+    def _remember(self, prompt_text, text):
+        self.history = [
+            *self.history,
+            {"role": "user", "parts": [prompt_text]},
+            {"role": "model", "parts": [text]},
+        ]
+
+
+class FakeModel:
+    """نموذج بواجهة GenerativeModel (start_chat) يرد بعدد ثابت من النقاط"""
+
+    def __init__(self, backend, bullet_count=5):
+        self.backend = backend
+        self.bullet_count = bullet_count
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def start_chat(self, history=()):
+        return FakeChat(self, history)
+
+    def answer_text(self):
+        with self._lock:
+            self.calls += 1
+        facts = [_FAKE_FACTS[i % len(_FAKE_FACTS)] for i in range(self.bullet_count)]
+        return "\n".join(f"• {fact}" for fact in facts)
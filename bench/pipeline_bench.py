@@ -0,0 +1,222 @@
+"""قياس زمن كل مرحلة في خط معالجة السؤال مع مستخدمين متزامنين
+
+الاستخدام:
+    python -m bench.pipeline_bench --users 8 --queries 5 --output bench.json
+    python -m bench.pipeline_bench --compare bench.json
+
+كل سؤال يمر بنفس كود التطبيق: start_recognition ثم answer_question (Gemini
+واستخراج النقاط وتحويلها إلى صوت عبر محرك الطلبات) ثم prepare_player_sources.
+إلى جانب زمن هذه الخطوات يُحسب مئين كل مرحلة داخلية من أزمنة assistant.metrics
+(METRIC_STAGES) كما تسجلها الوحدات نفسها.
+الخدمات الخارجية فقط تُستبدل ببدائل محلية ذات زمن استجابة وتذبذب قابلين للضبط
+(bench/fakes.py)، وباقي الإعدادات تُقرأ من متغيرات البيئة كما في التطبيق، مثل:
+    TTS_MAX_WORKERS=8 TTS_MAX_CONCURRENCY=16 python -m bench.pipeline_bench
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from assistant import metrics
+from assistant.audio_cache import AudioCache, get_audio_cache
+from assistant.audio_store import AUDIO_STORE_MAX_BYTES, prepare_player_sources, set_clip_store
+from assistant.engine import answer_question
+from assistant.streaming import STREAM_RESPONSES
+from assistant.stt import set_stt_backend, start_recognition
+from assistant.tts import set_tts_engine
+from bench.fakes import FakeBackend, FakeModel, SlowSTT, SlowTTS
+
+STAGES = ["transcribe", "answer", "player", "total"]
+
+# مراحل تسجلها وحدات المشروع في assistant.metrics (stream_* في وضع البث فقط،
+# و extract_bullets بدونه)
+METRIC_STAGES = [
+    "gemini",
+    "extract_bullets",
+    "tts_total",
+    "stream_first_bullet",
+    "stream_first_clip",
+    "first_audio",
+]
+
+
+def percentile(values, pct):
+    """المئين بطريقة أقرب رتبة"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def run_query(model, recording, timings, stream, use_cache):
+    """سؤال واحد من تسجيل المستخدم حتى تجهيز المشغل"""
+    def timed(stage, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[stage].append(time.perf_counter() - started)
+        return result
+
+    started = time.perf_counter()
+    text = timed("transcribe", lambda: start_recognition(recording).result())
+    answer_started = time.perf_counter()
+    answer = timed(
+        "answer", answer_question, model, text,
+        chat_session=model.start_chat(history=[]), use_cache=use_cache, stream=stream,
+    )
+    timed("player", prepare_player_sources, answer.audio_ids)
+    # نفس نقطة التسجيل في التطبيق: المشغل جاهز للتشغيل
+    metrics.observe("first_audio", time.perf_counter() - answer_started)
+    timings["total"].append(time.perf_counter() - started)
+    return answer
+
+
+def run_benchmark(args):
+    # مجلد مؤقت لملفات المشغل حتى لا يمتلئ static/audio بملفات القياس
+    set_clip_store(AudioCache(AUDIO_STORE_MAX_BYTES, tempfile.mkdtemp(prefix="bench-audio-"), sharded=False))
+    set_stt_backend(SlowSTT(FakeBackend(args.stt_latency, args.jitter)))
+    set_tts_engine(SlowTTS(FakeBackend(args.tts_latency, args.jitter)))
+    model = FakeModel(FakeBackend(args.gemini_latency, args.jitter), args.bullets)
+
+    audio_cache = get_audio_cache()
+    if not args.audio_cache:
+        # ذاكرة بسعة صفر: كل نقطة تُرسل لمحرك الصوت (مع دمج الطلبات المتزامنة فقط)
+        audio_cache.max_bytes = 0
+    audio_cache.clear()
+
+    timings = {stage: [] for stage in STAGES + METRIC_STAGES}
+    incomplete = 0
+    lock = threading.Lock()
+
+    def record_metric(stage, seconds):
+        if stage in METRIC_STAGES:
+            with lock:
+                timings[stage].append(seconds)
+    # ثانية واحدة من صوت PCM أحادي 16-bit بمعدل 16kHz بنفس واجهة AudioSegment
+    recording = SimpleNamespace(raw_data=b"\x00\x00" * 16000, frame_rate=16000, sample_width=2, channels=1)
+
+    def simulated_user(_):
+        nonlocal incomplete
+        local = {stage: [] for stage in STAGES}
+        failed = 0
+        for _ in range(args.queries):
+            answer = run_query(model, recording, local, args.stream, args.answer_cache)
+            failed += 0 if answer.is_complete else 1
+        with lock:
+            incomplete += failed
+            for stage, values in local.items():
+                timings[stage].extend(values)
+
+    tracemalloc.start()
+    metrics.add_listener(record_metric)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            list(executor.map(simulated_user, range(args.users)))
+    finally:
+        metrics.remove_listener(record_metric)
+    wall_time = time.perf_counter() - started
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_queries = args.users * args.queries
+    return {
+        "commit": _current_commit(),
+        "config": vars(args) | {"output": None, "compare": None},
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+        "wall_time": wall_time,
+        "throughput_qps": total_queries / wall_time if wall_time else None,
+        "gemini_calls": model.calls,
+        "incomplete_answers": incomplete,
+        "peak_memory": {
+            "tracemalloc_bytes": peak_traced,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        "audio_cache": audio_cache.stats() if args.audio_cache else None,
+    }
+
+
+def _current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """طباعة نسبة التغير في p50/p95/p99 لكل مرحلة مقارنة بنتيجة سابقة"""
+    header = "".join(f"{key + ' base':>10}{key + ' now':>10}{'Δ%':>8}" for key in ("p50", "p95", "p99"))
+    lines = [f"{'stage (ms)':<22}{header}"]
+    for stage in STAGES + METRIC_STAGES:
+        old, new = baseline["stages"].get(stage), current["stages"].get(stage)
+        if not old or not new or not old["count"] or not new["count"]:
+            continue
+        row = f"{stage:<22}"
+        for key in ("p50", "p95", "p99"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            row += f"{old[key] * 1000:>10.1f}{new[key] * 1000:>10.1f}{change:>+7.1f}%"
+        lines.append(row)
+    lines.append(
+        f"throughput: {baseline['throughput_qps']:.2f} -> {current['throughput_qps']:.2f} q/s"
+    )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="قياس أداء خط معالجة الأسئلة")
+    parser.add_argument("--users", type=int, default=4, help="عدد المستخدمين المتزامنين")
+    parser.add_argument("--queries", type=int, default=5, help="عدد الأسئلة لكل مستخدم")
+    parser.add_argument("--bullets", type=int, default=5, help="عدد النقاط في كل رد")
+    parser.add_argument("--stt-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-latency", type=float, default=1.0)
+    parser.add_argument("--tts-latency", type=float, default=0.4)
+    parser.add_argument("--jitter", type=float, default=0.1, help="تذبذب زمن الاستجابة (±ثانية)")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=STREAM_RESPONSES,
+                        help="قراءة رد Gemini على دفعات كما في التطبيق")
+    parser.add_argument("--audio-cache", action="store_true", help="تفعيل ذاكرة الصوت المؤقتة")
+    parser.add_argument("--answer-cache", action="store_true",
+                        help="تفعيل ذاكرة الإجابات (الأسئلة المتطابقة تُخدم منها بعد أول رد)")
+    parser.add_argument("--output", help="حفظ النتيجة في ملف JSON")
+    parser.add_argument("--compare", help="مقارنة النتيجة بملف JSON سابق")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run_benchmark(args)
+
+    report = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(json.load(f), result), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from assistant.answer_cache import AnswerCache, content_tokens, normalize_arabic
+
+
+def test_normalize_arabic_unifies_spelling():
+    assert normalize_arabic("مَنْ هُوَ رمسيس الثاني؟") == "من هو رمسيس الثاني"
+    assert normalize_arabic("إخناتون") == normalize_arabic("اخناتون")
+    assert normalize_arabic("الملكة حتشبسوت") == "الملكه حتشبسوت"
+    assert normalize_arabic("مصــر") == "مصر"
+
+
+def test_exact_match_after_normalization():
+    cache = AnswerCache(similarity=0)
+    cache.put("من هو رمسيس الثاني؟", ["نقطة"], ["a.mp3"])
+    assert cache.get("مَن هو رمسيس الثاني").bullets == ["نقطة"]
+
+
+def test_fuzzy_matching_is_off_by_default():
+    cache = AnswerCache()
+    cache.put("من هو رمسيس الثاني؟", ["نقطة"], ["a.mp3"])
+    assert cache.get("مين رمسيس الثاني") is None
+
+
+def test_ordinals_never_match_a_different_king():
+    pairs = [
+        ("من هو رمسيس الثاني؟", "من هو رمسيس الثالث"),
+        ("من هو تحتمس الثالث", "من هو تحتمس الثاني"),
+        ("من هو أمنحتب الثالث", "من هو أمنحتب الثاني"),
+    ]
+    for similarity in (0, 0.5, 0.85):
+        for cached, asked in pairs:
+            cache = AnswerCache(similarity=similarity)
+            cache.put(cached, ["نقطة"], ["a.mp3"])
+            assert cache.get(asked) is None, (similarity, cached, asked)
+
+
+def test_near_match_needs_the_same_content_words():
+    cache = AnswerCache(similarity=0.5)
+    cache.put("من هو رمسيس الثاني", ["نقطة"], ["a.mp3"])
+    assert cache.get("مين رمسيس الثاني") is not None
+    assert content_tokens("من هو رمسيس الثاني") == content_tokens("مين رمسيس الثاني")
+
+
+def test_disk_tier_is_shared_between_caches(tmp_path):
+    warmup = AnswerCache(disk_dir=str(tmp_path))
+    app = AnswerCache(disk_dir=str(tmp_path))
+    warmup.put("من هي كليوباترا؟", ["نقطة"], ["a.mp3"])
+
+    # إجابة أضافتها عملية أخرى بعد إنشاء الذاكرة، ثم ذاكرة جديدة بعد إعادة التشغيل
+    assert app.get("من هي كليوباترا").audio_ids == ["a.mp3"]
+    assert AnswerCache(disk_dir=str(tmp_path)).get("من هي كليوباترا").bullets == ["نقطة"]
+
+
+def test_expired_disk_answers_are_removed(tmp_path):
+    AnswerCache(disk_dir=str(tmp_path)).put("من هي نفرتيتي؟", ["نقطة"], ["a.mp3"])
+    assert AnswerCache(ttl=-1, disk_dir=str(tmp_path)).get("من هي نفرتيتي") is None
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,52 @@
+import pytest
+
+from assistant import audio_store
+from assistant.audio_cache import AudioCache
+from assistant.audio_workers import AudioWorkerPool
+
+
+@pytest.fixture(autouse=True)
+def clip_store(monkeypatch, tmp_path):
+    store = AudioCache(1 << 20, str(tmp_path), sharded=False)
+    monkeypatch.setattr(audio_store, "_clip_store", store)
+    monkeypatch.setattr(audio_store, "get_audio_workers", lambda: AudioWorkerPool(max_workers=0))
+    return store
+
+
+def test_mp3_clips_have_a_single_source():
+    clip_id = audio_store.store_audio(b"mp3 frames", ext="mp3")
+
+    sources, chapters = audio_store.prepare_player_sources([clip_id], single_stream=False)
+
+    assert sources == [[[audio_store.audio_url(clip_id), "audio/mpeg"]]]
+    assert chapters == []
+
+
+def test_opus_clips_fall_back_to_mp3(monkeypatch, clip_store):
+    transcoded = []
+    monkeypatch.setattr(audio_store, "transcode_speech", lambda audio, fmt: transcoded.append(fmt) or b"mp3")
+    clip_id = audio_store.store_audio(b"ogg pages", ext="ogg")
+
+    for _ in range(2):
+        sources, _ = audio_store.prepare_player_sources([clip_id], single_stream=False)
+
+    fallback_id = audio_store.fallback_clip_id(clip_id)
+    assert sources == [[
+        [audio_store.audio_url(clip_id), "audio/ogg; codecs=opus"],
+        [audio_store.audio_url(fallback_id), "audio/mpeg"],
+    ]]
+    # تُنشأ النسخة الاحتياطية مرة واحدة فقط
+    assert [fmt.name for fmt in transcoded] == ["mp3-low"]
+    assert clip_store.get(fallback_id) == b"mp3"
+
+
+def test_failed_fallback_keeps_the_primary_source(monkeypatch):
+    def broken(audio, audio_format):
+        raise RuntimeError("ffmpeg غير مثبت على الخادم")
+
+    monkeypatch.setattr(audio_store, "transcode_speech", broken)
+    clip_id = audio_store.store_audio(b"ogg pages", ext="ogg")
+
+    sources, _ = audio_store.prepare_player_sources([clip_id], single_stream=False)
+
+    assert sources == [[[audio_store.audio_url(clip_id), "audio/ogg; codecs=opus"]]]
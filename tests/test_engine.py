@@ -0,0 +1,77 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from assistant import audio_store, engine, tts
+from assistant.answer_cache import AnswerCache
+from assistant.audio_cache import AudioCache
+
+RESPONSE = "• رمسيس الثاني من أشهر فراعنة مصر القديمة\n• حكم مصر نحو ستة وستين عاماً\n"
+
+
+class FakeChat:
+    def __init__(self, model):
+        self.model = model
+        self.history = []
+
+    def send_message(self, text, stream=False):
+        self.model.calls += 1
+        self.model.release.wait(5)
+        self.history = [*self.history, {"role": "user", "parts": [text]}, {"role": "model", "parts": [RESPONSE]}]
+        return SimpleNamespace(text=RESPONSE, usage_metadata=None)
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def start_chat(self, history):
+        return FakeChat(self)
+
+
+@pytest.fixture(autouse=True)
+def isolated_stores(monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "get_answer_cache", lambda cache=AnswerCache(): cache)
+    monkeypatch.setattr(audio_store, "_clip_store", AudioCache(1 << 20, str(tmp_path), sharded=False))
+    monkeypatch.setattr(tts, "_tts_engine", tts.FakeEngine())
+
+
+def test_app_sessions_and_background_callers_share_one_question_flight():
+    model = FakeModel()
+    sessions = [model.start_chat(history=[]) for _ in range(3)]
+    answers = []
+
+    def ask(chat_session):
+        answers.append(engine.answer_question(model, "من هو رمسيس الثاني؟", chat_session=chat_session))
+
+    threads = [threading.Thread(target=ask, args=(session,)) for session in sessions]
+    # سؤال بدون جلسة كما يرسله التسخين أو الدفعات
+    threads.append(threading.Thread(target=ask, args=(None,)))
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    model.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert model.calls == 1
+    assert sorted(answer.source for answer in answers) == ["gemini", "shared", "shared", "shared"]
+    assert all(answer.is_complete for answer in answers)
+    # كل جلسة فيها السؤال والإجابة سواء أرسلته بنفسها أم انتظرت غيرها
+    assert all(len(session.history) == 2 for session in sessions)
+
+
+def test_cached_answer_is_added_to_the_session_history():
+    model = FakeModel()
+    model.release.set()
+    engine.answer_question(model, "من هو رمسيس الثاني؟")
+
+    session = model.start_chat(history=[])
+    answer = engine.answer_question(model, "من هو رمسيس الثاني", chat_session=session)
+
+    assert answer.source == "cache"
+    assert model.calls == 1
+    assert [turn["role"] for turn in session.history] == ["user", "model"]
@@ -0,0 +1,25 @@
+from assistant.mp3_concat import concat_mp3, mp3_frames, strip_tags
+from assistant.tts import _SILENT_FRAME, _SILENT_FRAME_SECONDS
+
+ID3V2 = b"ID3\x03\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+ID3V1 = b"TAG" + b"\x00" * 125
+
+
+def test_strip_tags_removes_id3_headers_and_trailers():
+    assert strip_tags(ID3V2 + _SILENT_FRAME + ID3V1) == _SILENT_FRAME
+
+
+def test_mp3_frames_skips_junk_and_measures_duration():
+    frames, duration = mp3_frames(b"junk" + _SILENT_FRAME * 3)
+    assert frames == _SILENT_FRAME * 3
+    assert abs(duration - 3 * _SILENT_FRAME_SECONDS) < 1e-9
+
+
+def test_concat_mp3_joins_frames_with_chapter_offsets():
+    first = ID3V2 + _SILENT_FRAME * 2 + ID3V1
+    second = _SILENT_FRAME * 3
+
+    joined, chapters = concat_mp3([first, b"not audio", second])
+
+    assert joined == _SILENT_FRAME * 5
+    assert chapters == [0.0, round(2 * _SILENT_FRAME_SECONDS, 3)]
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from assistant.rate_limit import FileTokenBucket, TokenBucket, backoff_delay, is_retryable
+
+
+def test_token_bucket_allows_burst_then_asks_to_wait():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    assert TokenBucket(rate=0, burst=1).reserve() == 0
+
+
+def test_file_token_bucket_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / "gemini.bucket")
+    app, batch = FileTokenBucket(path, rate=1, burst=2), FileTokenBucket(path, rate=1, burst=2)
+    assert app.reserve() == 0
+    assert batch.reserve() == 0
+    assert app.reserve() > 0.9
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error", [
+    ResourceExhausted("quota"),
+    SimpleNamespace(code=429),
+    SimpleNamespace(response=SimpleNamespace(status_code=503)),
+    RuntimeError("429 Too Many Requests"),
+    RuntimeError("Service Unavailable"),
+])
+def test_temporary_errors_are_retryable(error):
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize("error", [
+    ValueError("الرسالة فارغة"),
+    SimpleNamespace(code=400),
+    SimpleNamespace(response=SimpleNamespace(status_code=403)),
+])
+def test_permanent_errors_are_not_retryable(error):
+    assert not is_retryable(error)
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, base=0.5, cap=2) <= 2 for attempt in range(1, 10))
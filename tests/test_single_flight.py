@@ -0,0 +1,184 @@
+import threading
+import time
+
+import pytest
+
+from assistant.request_engine import (
+    PRIORITY_BACKGROUND,
+    CancelToken,
+    QueryCancelled,
+    RequestEngine,
+    cancel_scope,
+    observe_calls,
+    with_priority,
+)
+from assistant.single_flight import SingleFlight
+
+
+def run_concurrently(flight, func, count=4):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do("key", func))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def slow(result=None, error=None, calls=None):
+    def func():
+        calls.append(1)
+        time.sleep(0.2)
+        if error is not None:
+            raise error
+        return result
+    return func
+
+
+def test_concurrent_identical_calls_run_once():
+    calls = []
+    results, errors = run_concurrently(SingleFlight("test"), slow("answer", calls=calls))
+
+    assert not errors
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {result for result, _ in results} == {"answer"}
+
+
+def test_errors_are_shared_with_waiting_calls():
+    calls = []
+    results, errors = run_concurrently(SingleFlight("test"), slow(error=RuntimeError("503"), calls=calls))
+
+    assert len(calls) == 1
+    assert not results
+    assert len(errors) == 4
+
+
+def test_retry_errors_are_not_shared():
+    flight = SingleFlight("test", retry_errors=(QueryCancelled,))
+    calls = []
+
+    def func():
+        calls.append(1)
+        time.sleep(0.2)
+        # أول طلب أُلغي، فيعيد المنتظرون المحاولة بأنفسهم
+        if len(calls) == 1:
+            raise QueryCancelled()
+        return "answer"
+
+    results, errors = run_concurrently(flight, func)
+
+    assert len(errors) == 1 and isinstance(errors[0], QueryCancelled)
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert len(calls) == 2
+    assert flight.in_flight() == 0
+
+
+def test_keys_are_released_after_each_call():
+    flight = SingleFlight("test")
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.in_flight() == 0
+
+
+class Blocker:
+    """يحجز المكان الوحيد لخدمة في محرك الطلبات حتى release"""
+
+    def __init__(self, engine):
+        self.released = threading.Event()
+        self.future = engine.submit("tts", self.released.wait, 5)
+        time.sleep(0.1)
+
+    def release(self):
+        self.released.set()
+        self.future.result()
+
+
+class Clock:
+    def __init__(self):
+        self.events = []
+
+    def queued(self, request):
+        self.events.append("queued")
+
+    def started(self):
+        self.events.append("started")
+
+
+def test_waiting_call_follows_the_queued_leader_clock():
+    engine = RequestEngine(limits={"tts": 1})
+    flight = SingleFlight("test")
+    blocker = Blocker(engine)
+    leader = threading.Thread(target=flight.do, args=("key", engine.run, "tts", lambda: "audio"))
+    leader.start()
+    time.sleep(0.1)
+
+    clock = Clock()
+    results = []
+
+    def wait_for_leader():
+        with observe_calls(clock):
+            results.append(flight.do("key", lambda: "again"))
+
+    follower = threading.Thread(target=wait_for_leader)
+    follower.start()
+    time.sleep(0.1)
+    # الطلب الأول ما زال في الطابور فتتوقف ساعة المنتظر
+    assert clock.events == ["queued"]
+
+    blocker.release()
+    leader.join()
+    follower.join()
+    assert clock.events == ["queued", "started"]
+    assert results == [("audio", True)]
+
+
+def test_cancelled_waiting_call_stops_waiting():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("key", release.wait, 5))
+    leader.start()
+    time.sleep(0.1)
+
+    token = CancelToken()
+    token.cancel()
+    started = time.monotonic()
+    with cancel_scope(token), pytest.raises(QueryCancelled):
+        flight.do("key", lambda: "again")
+    assert time.monotonic() - started < 1
+
+    release.set()
+    leader.join()
+
+
+def test_interactive_waiting_call_raises_the_background_leader_priority():
+    engine = RequestEngine(limits={"tts": 1})
+    flight = SingleFlight("test")
+    order = []
+    blocker = Blocker(engine)
+
+    def background(name):
+        return with_priority(PRIORITY_BACKGROUND, flight.do, name, engine.run, "tts", order.append, name)
+
+    threads = [threading.Thread(target=background, args=(name,)) for name in ("other", "warmup")]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+    # سؤال تفاعلي ينتظر نفس طلب التسخين
+    follower = threading.Thread(target=flight.do, args=("warmup", lambda: None))
+    follower.start()
+    time.sleep(0.1)
+
+    blocker.release()
+    for thread in [*threads, follower]:
+        thread.join()
+    assert order == ["warmup", "other"]
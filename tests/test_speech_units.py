@@ -0,0 +1,35 @@
+from assistant.speech_units import split_speech_units
+
+LONG_BULLET = (
+    "حكم الملك رمسيس الثاني مصر قرابة سبعة وستين عاماً، "
+    "وشيّد معبد أبو سمبل الشهير في جنوب مصر تخليداً لانتصاراته. "
+    "ووقّع أول معاهدة سلام مكتوبة في التاريخ مع الحيثيين بعد معركة قادش، "
+    "وكانت أشهر زوجاته الملكة نفرتاري."
+)
+
+
+def words(units):
+    return " ".join(units).split()
+
+
+def test_short_text_is_one_unit():
+    assert split_speech_units("  نص قصير  ", max_chars=100) == ["نص قصير"]
+    assert split_speech_units(LONG_BULLET, max_chars=0) == [LONG_BULLET]
+
+
+def test_long_text_splits_at_clauses_into_balanced_units():
+    units = split_speech_units(LONG_BULLET, max_chars=100)
+
+    # أقل عدد ممكن 3 (نحو 210 أحرف)، وأكثر عدد هو جمله الأربع
+    assert 3 <= len(units) <= 4
+    assert all(len(unit) <= 100 for unit in units)
+    assert words(units) == LONG_BULLET.split()
+    assert all(unit.endswith(("،", ".")) for unit in units)
+
+
+def test_clause_longer_than_limit_splits_at_spaces():
+    text = " ".join(["كلمة"] * 40)
+    units = split_speech_units(text, max_chars=50)
+
+    assert all(len(unit) <= 50 for unit in units)
+    assert words(units) == text.split()
@@ -0,0 +1,91 @@
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+sr = pytest.importorskip("speech_recognition")
+
+from assistant import stt
+from assistant.audio_workers import AudioWorkerPool
+
+
+def recorder_segment(raw_data, channels=1, frame_rate=16000, sample_width=2):
+    # نفس الخصائص التي يقرؤها audio_data_from_segment من AudioSegment
+    return SimpleNamespace(raw_data=raw_data, channels=channels, frame_rate=frame_rate, sample_width=sample_width)
+
+
+class OfflineSTT(stt.STTBackend):
+    def recognize(self, audio_data):
+        raise sr.RequestError("لا يوجد اتصال")
+
+
+@pytest.fixture
+def stt_backend(monkeypatch):
+    def use(backend):
+        monkeypatch.setattr(stt, "_stt_backend", backend)
+
+    return use
+
+
+def test_fake_stt_returns_the_same_text_every_time():
+    backend = stt.FakeSTT("من بنى الأهرامات")
+
+    assert [backend.recognize(None) for _ in range(3)] == ["من بنى الأهرامات"] * 3
+
+
+def test_fake_stt_without_text_is_not_understood():
+    with pytest.raises(sr.UnknownValueError):
+        stt.FakeSTT("").recognize(None)
+
+
+def test_unknown_backend_name_is_rejected():
+    with pytest.raises(ValueError):
+        stt.create_stt_backend("whisper")
+
+
+def test_mono_segment_is_passed_through(monkeypatch):
+    monkeypatch.setattr(stt, "get_audio_workers", lambda: pytest.fail("لا حاجة لعمليات الصوت مع قناة واحدة"))
+    raw_data = struct.pack("<4h", 1, -2, 300, -400)
+
+    audio_data = stt.audio_data_from_segment(recorder_segment(raw_data))
+
+    assert audio_data.frame_data == raw_data
+    assert (audio_data.sample_rate, audio_data.sample_width) == (16000, 2)
+
+
+def test_stereo_segment_is_downmixed_in_the_audio_workers(monkeypatch):
+    pytest.importorskip("pydub")
+    runs = []
+
+    class RecordingPool(AudioWorkerPool):
+        def run(self, func, *args, owner=None):
+            runs.append(owner)
+            return super().run(func, *args, owner=owner)
+
+    monkeypatch.setattr(stt, "get_audio_workers", lambda: RecordingPool(max_workers=0))
+    raw_data = struct.pack("<hh", 1000, 3000) * 8
+
+    audio_data = stt.audio_data_from_segment(recorder_segment(raw_data, channels=2), owner="session")
+
+    assert runs == ["session"]
+    assert audio_data.frame_data == struct.pack("<h", 2000) * 8
+
+
+def test_recognition_runs_the_selected_backend(stt_backend):
+    stt_backend(stt.FakeSTT("من هو خوفو"))
+
+    future = stt.start_recognition(recorder_segment(b"\0\0" * 160))
+
+    assert stt.finish_recognition(future) == ("من هو خوفو", None)
+
+
+def test_recognition_errors_become_messages(stt_backend):
+    segment = recorder_segment(b"\0\0" * 160)
+
+    stt_backend(stt.FakeSTT(""))
+    text, error = stt.finish_recognition(stt.start_recognition(segment))
+    assert text is None and "لم أستطع فهم الصوت" in error
+
+    stt_backend(OfflineSTT())
+    text, error = stt.finish_recognition(stt.start_recognition(segment))
+    assert text is None and error == "خطأ في خدمة التعرف على الكلام: لا يوجد اتصال"
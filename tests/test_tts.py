@@ -0,0 +1,69 @@
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+gtts = pytest.importorskip("gtts")
+requests = pytest.importorskip("requests")
+
+from assistant import tts
+
+
+def rpc_response(audio, status_code=200):
+    def raise_for_status():
+        if status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{status_code} Error")
+
+    encoded = base64.b64encode(audio).decode("ascii")
+    text = f')]}}\'\n\n[["wrb.fr","jQ1olc","[\\"{encoded}\\"]",null,null,null,"generic"]]' if audio else "[]"
+    return SimpleNamespace(status_code=status_code, reason="OK" if status_code < 400 else "Error",
+                           text=text, raise_for_status=raise_for_status)
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.bodies = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        assert url.endswith("/_/TranslateWebserverUi/data/batchexecute")
+        self.bodies.append(data)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def use(*responses):
+        fake = FakeSession(*responses)
+        monkeypatch.setattr(tts, "get_http_session", lambda backend: fake)
+        return fake
+
+    return use
+
+
+def test_gtts_parts_share_one_session(session):
+    # أكثر من 100 حرف: gTTS يقسم النص إلى عدة طلبات
+    text = "رمسيس الثاني من أشهر فراعنة مصر القديمة، حكم البلاد نحو ستة وستين عاماً. " * 2
+    bodies = gtts.gTTS(text=text, lang="ar").get_bodies()
+    parts = [f"part-{index}".encode() for index in range(len(bodies))]
+    fake = session(*[rpc_response(part) for part in parts])
+
+    audio = tts.GTTSEngine().synthesize(text)
+
+    assert len(bodies) > 1
+    assert audio == b"".join(parts)
+    assert fake.bodies == bodies
+
+
+def test_gtts_http_errors_keep_gtts_messages(session):
+    session(rpc_response(b"", status_code=429))
+
+    with pytest.raises(gtts.gTTSError, match="429"):
+        tts.GTTSEngine().synthesize("مرحبا")
+
+
+def test_gtts_response_without_audio_is_an_error(session):
+    session(rpc_response(b""))
+
+    with pytest.raises(gtts.gTTSError):
+        tts.GTTSEngine().synthesize("مرحبا")